@@ -0,0 +1,199 @@
+"""
+Local stand-in for the MMT APIv2 endpoints used by tom_mmt, with configurable latency and payload sizes
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import Counter
+from datetime import datetime, timedelta
+from tempfile import NamedTemporaryFile
+from urllib.request import urlopen
+from io import BytesIO
+import multiprocessing
+import threading
+import tarfile
+import shutil
+import json
+import time
+import re
+import os
+
+
+class ZeroFile:
+    """File-like object that reads as a given number of zero bytes without allocating them all at once"""
+    def __init__(self, size):
+        self.remaining = size
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        self.remaining -= size
+        return bytes(size)
+
+
+def make_spectrum(size, seed=0):
+    """Return a 1D spectrum in FITS format, like the Binospec pipeline's, of about size bytes"""
+    from astropy.io import fits
+    import numpy as np
+    n_pixels = max((size - 2880) // 4, 1)
+    hdu = fits.PrimaryHDU(np.random.default_rng(seed).normal(1e-17, 1e-18, n_pixels).astype(np.float32))
+    hdu.header.update({'CRVAL1': 3900., 'CRPIX1': 1., 'CDELT1': 6000. / n_pixels, 'CTYPE1': 'WAVE',
+                       'INSTRUME': 'Binospec', 'EXPTIME': 900., 'DATE-OBS': f'2026-01-01T{seed % 24:02d}:00:00'})
+    f = BytesIO()
+    hdu.writeto(f)
+    return f.getvalue()
+
+
+def make_tarball(path, n_spectra, spectrum_size, padding_size=0, prefix='reduced'):
+    """Write a reduced tarball with n_spectra _B.fits members and one padding member that is not ingested"""
+    with tarfile.open(path, 'w') as tar:
+        for i in range(n_spectra):
+            spectrum = make_spectrum(spectrum_size, seed=i)
+            info = tarfile.TarInfo(f'{prefix}/obj{i:03d}_B.fits')
+            info.size = len(spectrum)
+            tar.addfile(info, BytesIO(spectrum))
+        if padding_size:
+            info = tarfile.TarInfo(f'{prefix}/frames.fits')
+            info.size = padding_size
+            tar.addfile(info, ZeroFile(padding_size))
+
+
+class FakeMMTServer:
+    """
+    Serves the target, datalist, image download, and trimester schedule endpoints on localhost, in a separate process
+    so that it does not compete with the code being benchmarked. Every response is delayed by `latency` seconds, and
+    every request is counted by endpoint.
+    """
+    def __init__(self, **config):
+        self.config = config
+        self.process = None
+        self.url = None
+
+    def __enter__(self):
+        ready = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=serve, args=(ready,), kwargs=self.config, daemon=True)
+        self.process.start()
+        self.url = ready.get(timeout=60)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        self.process.join()
+
+    def counts(self, reset=False):
+        with urlopen(f'{self.url}/_counts' + ('?reset=1' if reset else '')) as response:
+            return json.load(response)
+
+
+def serve(ready, **config):
+    server = FakeMMTAPI(**config)
+    try:
+        ready.put(server.url)
+        server.httpd.serve_forever()
+    finally:
+        os.remove(server.tarball)
+
+
+class FakeMMTAPI:
+    def __init__(self, latency=0.05, files_per_target=3, file_size=20 * 1024 ** 2, spectra_per_file=10,
+                 spectrum_size=1024 ** 2):
+        self.latency = latency
+        self.files_per_target = files_per_target
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        with NamedTemporaryFile(suffix='.tar', delete=False) as f:
+            self.tarball = f.name
+        make_tarball(self.tarball, spectra_per_file, spectrum_size,
+                     max(file_size - spectra_per_file * (spectrum_size + 512) - 10240, 0))
+        self.file_size = os.path.getsize(self.tarball)
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}/APIv2'
+
+    def count(self, endpoint):
+        with self._lock:
+            self.counts[endpoint] += 1
+
+    def schedule(self):
+        now = datetime.now()
+        runs = []
+        for day in range(-60, 60):  # a trimester of one-night runs
+            start = now.replace(hour=12, minute=0, second=0, microsecond=0) + timedelta(days=day)
+            runs.append({
+                'start': start.strftime('%Y-%m-%d %H:%M:%S-00'),
+                'end': (start + timedelta(days=1)).strftime('%Y-%m-%d'),
+                'title': f'Run {day}',
+                'instrument': {'id': 16, 'name': 'Binospec'} if day % 2 else None,
+            })
+        return {'published': {'queues': [], 'runs': runs}}
+
+    def datalist(self, targetid):
+        return [{
+            'name': f'{targetid}_reduced',
+            'datafiles': [{'id': int(targetid) * 100 + i, 'filename': f'{targetid}_{i}.tar', 'type': 'reduced'}
+                          for i in range(self.files_per_target)],
+        }]
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True  # otherwise small responses wait for delayed ACKs
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, data, status=200):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_file(self):
+                start = 0
+                match = re.match(r'bytes=(\d+)-', self.headers.get('Range', ''))
+                if match:
+                    start = int(match.group(1))
+                self.send_response(206 if match else 200)
+                self.send_header('Content-Type', 'application/x-tar')
+                self.send_header('Content-Length', str(server.file_size - start))
+                self.end_headers()
+                with open(server.tarball, 'rb') as f:
+                    f.seek(start)
+                    shutil.copyfileobj(f, self.wfile, 1024 ** 2)
+
+            def do_GET(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                path = self.path[len('/APIv2'):]
+                if path.startswith('/_counts'):
+                    with server._lock:
+                        self.send_json(server.counts)
+                        if 'reset' in path:
+                            server.counts.clear()
+                    return
+                time.sleep(server.latency)
+                if match := re.match(r'/catalogTarget/(\d+)', path):
+                    server.count('target')
+                    self.send_json({'id': int(match.group(1)), 'disabled': 0, 'iscomplete': 0,
+                                    'percentcompleted': 50.})
+                elif match := re.match(r'/data/list/catalogtarget/(\d+)', path):
+                    server.count('datalist')
+                    self.send_json(server.datalist(match.group(1)))
+                elif path.startswith('/data/download/datafile/'):
+                    server.count('download')
+                    self.send_file()
+                elif path.startswith('/trimester//schedule/all'):
+                    server.count('schedule')
+                    self.send_json(server.schedule())
+                else:
+                    server.count('not found')
+                    self.send_json({'error': 'not found'}, status=404)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                time.sleep(server.latency)
+                server.count('post')
+                self.send_json({'id': 1})
+
+        return Handler
@@ -0,0 +1,61 @@
+"""
+Measures the time taken to import tom_mmt.mmt in a fresh Django process, after the TOM Toolkit modules that it
+extends, and checks that it does not import the slow dependencies that are only needed once the MMT is used. Run from
+the repository root:
+
+    python benchmarks/import_time.py [--repeat 5]
+
+Exits with an error if any of those dependencies are imported.
+"""
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+import statistics
+import subprocess
+import json
+import sys
+import os
+
+DEFERRED_MODULES = ['pymmt', 'requests', 'astropy.coordinates', 'astropy.io.fits', 'astropy.time',
+                    'crispy_forms.bootstrap']
+
+CHILD = """
+import django, json, sys, time
+django.setup()
+import tom_observations.facility, tom_dataproducts.data_processor, tom_dataproducts.models, tom_targets.models
+before = set(sys.modules)
+start = time.perf_counter()
+import tom_mmt.mmt
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'modules': sorted(set(sys.modules) - before)}))
+"""
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=5, help='number of fresh processes to time')
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    with TemporaryDirectory() as benchmark_dir:
+        env = dict(os.environ, MMT_BENCHMARK_DIR=benchmark_dir, MMT_BENCHMARK_API_URL='http://localhost/APIv2',
+                   DJANGO_SETTINGS_MODULE='benchmarks.settings',
+                   PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+        for _ in range(args.repeat):
+            output = subprocess.run([sys.executable, '-c', CHILD], env=env, cwd=root, check=True,
+                                    capture_output=True, text=True).stdout
+            results.append(json.loads(output.splitlines()[-1]))
+
+    seconds = [result['seconds'] for result in results]
+    print(f'import tom_mmt.mmt: median {statistics.median(seconds) * 1000:.1f} ms, '
+          f'min {min(seconds) * 1000:.1f} ms over {len(seconds)} processes')
+    imported = sorted({module for module in results[0]['modules'] for deferred in DEFERRED_MODULES
+                       if module == deferred or module.startswith(deferred + '.')})
+    if imported:
+        print('imported modules that should be deferred until first use: {}'.format(', '.join(imported)))
+        sys.exit(1)
+    print('no deferred modules imported')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+Benchmarks for tom_mmt against a local fake MMT API. Run from the repository root:
+
+    python benchmarks/run.py [--latency 0.05] [--observations 200] [benchmark ...]
+
+Each benchmark reports its wall time, the number of requests made to the fake API by endpoint, and the peak memory
+allocated by Python while it ran. Tracing memory allocations slows down CPU-bound code, so use --no-memory for more
+accurate wall times.
+"""
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+import tracemalloc
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def measure(server, name, function, trace_memory=True):
+    server.counts(reset=True)
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    function()
+    wall_time = time.perf_counter() - start
+    peak_memory = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    tracemalloc.stop()
+    return name, wall_time, server.counts(), peak_memory
+
+
+def create_observations(n_observations):
+    from tom_targets.models import Target
+    from tom_observations.models import ObservationRecord
+    targets = [Target.objects.create(name=f'AT 2026bench{i:04d}', type='SIDEREAL', ra=i * 0.7 % 360.,
+                                     dec=i * 0.37 % 170. - 85.) for i in range(n_observations)]
+    ObservationRecord.objects.bulk_create([
+        ObservationRecord(target=target, facility='MMT', observation_id=str(1000 + i), status='PENDING',
+                          parameters={'program': 'a' * 32}) for i, target in enumerate(targets)
+    ])
+    return targets
+
+
+def bench_status(args, facility, targets):
+    observation_ids = [str(1000 + i) for i in range(len(targets))]
+    return {
+        'status (one at a time)': lambda: [facility.get_observation_status(observation_id)
+                                           for observation_id in observation_ids[:args.serial_limit]],
+        'status (batch)': lambda: facility.get_observation_statuses(observation_ids),
+    }
+
+
+def bench_save_data_products(args, facility, targets):
+    from tom_observations.models import ObservationRecord
+    record = ObservationRecord.objects.get(observation_id='1000')
+    return {
+        'save_data_products': lambda: facility.save_data_products(record),
+        'save_data_products (already synced)': lambda: facility.save_data_products(record),
+    }
+
+
+def bench_processor(args, facility, targets):
+    from django.core.files import File
+    from tom_dataproducts.models import DataProduct
+    from tom_observations.models import ObservationRecord
+    from tom_mmt.mmt import MMTDataProcessor
+    from benchmarks.fake_mmt import make_tarball
+    record = ObservationRecord.objects.get(observation_id='1001')
+    tarball = os.path.join(os.environ['MMT_BENCHMARK_DIR'], 'processor.tar')
+    make_tarball(tarball, args.spectra, args.spectrum_size, prefix='processor')
+    data_product = DataProduct.objects.create(product_id='processor_benchmark', target=record.target,
+                                              observation_record=record, data_product_type='MMT')
+    with open(tarball, 'rb') as f:
+        data_product.data.save('processor.tar', File(f))
+    return {'MMTDataProcessor': lambda: MMTDataProcessor().process_data(data_product)}
+
+
+def bench_forms(args, facility, targets):
+    from tom_mmt.mmt import MMTBinospecImagingForm
+    data = {'facility': 'MMT', 'observation_type': 'BINOSPEC_IMAGING', 'magnitude': 18., 'visits': 1, 'priority': 1,
+            'target_of_opportunity': True, 'exposure_time': 100, 'filter': 'r', 'number_of_exposures': 2,
+            'program': 'a' * 32, 'notes': ''}
+
+    def validate_forms():
+        for target in targets:
+            form = MMTBinospecImagingForm(dict(data, target_id=target.id))
+            form.is_valid()
+            form.is_valid()
+            form.observation_payload()
+
+    def build_payloads():
+        form = MMTBinospecImagingForm(dict(data, target_id=targets[0].id))
+        form.is_valid()
+        form.observation_payloads([target.id for target in targets])
+
+    return {'form validation': validate_forms, 'payloads (batch)': build_payloads}
+
+
+def bench_facility_status(args, facility, targets):
+    from django.core.cache import cache
+    return {
+        'facility status (cold)': lambda: (cache.clear(), facility.get_facility_status()),
+        'facility status (warm)': lambda: [facility.get_facility_status() for _ in range(100)],
+    }
+
+
+BENCHMARKS = {
+    'status': bench_status,
+    'save_data_products': bench_save_data_products,
+    'processor': bench_processor,
+    'forms': bench_forms,
+    'facility_status': bench_facility_status,
+}
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('benchmarks', nargs='*', default=list(BENCHMARKS),
+                        help='benchmarks to run: {} (default: all)'.format(', '.join(BENCHMARKS)))
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to each API response')
+    parser.add_argument('--observations', type=int, default=200, help='number of observations to poll')
+    parser.add_argument('--serial-limit', type=int, default=20,
+                        help='number of observations to poll one at a time, for comparison')
+    parser.add_argument('--files', type=int, default=3, help='number of reduced files per observation')
+    parser.add_argument('--file-size', type=int, default=50, help='size of each reduced file in MB')
+    parser.add_argument('--spectra-per-file', type=int, default=10, help='number of spectra in each reduced file')
+    parser.add_argument('--spectra', type=int, default=50, help='number of spectra in the processor tarball')
+    parser.add_argument('--spectrum-size', type=int, default=1024 ** 2, help='size of each spectrum in bytes')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='do not trace memory allocations, which slows down the code being measured')
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmarks: {}'.format(', '.join(sorted(unknown))))
+
+    from benchmarks.fake_mmt import FakeMMTServer
+    with TemporaryDirectory() as benchmark_dir, \
+            FakeMMTServer(latency=args.latency, files_per_target=args.files, file_size=args.file_size * 1024 ** 2,
+                          spectra_per_file=args.spectra_per_file, spectrum_size=args.spectrum_size) as server:
+        os.environ['MMT_BENCHMARK_DIR'] = benchmark_dir
+        os.environ['MMT_BENCHMARK_API_URL'] = server.url
+        os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+        import django
+        from django.core.management import call_command
+        django.setup()
+        call_command('migrate', verbosity=0)
+
+        from tom_mmt.mmt import MMTFacility
+        facility = MMTFacility()
+        targets = create_observations(args.observations)
+        results = []
+        for name in args.benchmarks:
+            for label, function in BENCHMARKS[name](args, facility, targets).items():
+                results.append(measure(server, label, function, trace_memory=not args.no_memory))
+
+    print(f"{'benchmark':<40}{'wall time (s)':>14}{'peak memory (MB)':>18}  requests")
+    for label, wall_time, counts, peak_memory in results:
+        requests = ', '.join(f'{endpoint}: {count}' for endpoint, count in sorted(counts.items())) or 'none'
+        peak_memory = '-' if peak_memory is None else f'{peak_memory / 1024 ** 2:.1f}'
+        print(f'{label:<40}{wall_time:>14.3f}{peak_memory:>18}  {requests}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Minimal TOM settings for running the benchmarks against the fake MMT API
+"""
+import os
+
+BENCHMARK_DIR = os.environ['MMT_BENCHMARK_DIR']  # set by run.py, and shared with any worker processes
+
+SECRET_KEY = 'benchmark'
+DEBUG = False
+INSTALLED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.sites',
+    'django_comments',
+    'crispy_forms',
+    'rest_framework',
+    'rest_framework.authtoken',
+    'guardian',
+    'allauth',
+    'allauth.account',
+    'allauth.mfa',
+    'allauth.socialaccount',
+    'django_tasks',
+    'django_tasks.backends.database',
+    'tom_common',
+    'tom_targets',
+    'tom_observations',
+    'tom_dataproducts',
+    'tom_mmt',
+]
+MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'allauth.account.middleware.AccountMiddleware',
+]
+TEMPLATES = [{'BACKEND': 'django.template.backends.django.DjangoTemplates', 'APP_DIRS': True,
+              'OPTIONS': {'context_processors': ['django.contrib.auth.context_processors.auth',
+                                                 'django.contrib.messages.context_processors.messages',
+                                                 'django.template.context_processors.request']}}]
+ROOT_URLCONF = 'tom_common.urls'
+DATABASES = {'default': {'ENGINE': 'django.db.backends.sqlite3',
+                         'NAME': os.path.join(BENCHMARK_DIR, 'db.sqlite3'),
+                         # take the write lock at the start of each transaction, so that concurrent ingestion
+                         # workers wait for each other instead of failing with "database is locked"
+                         'OPTIONS': {'timeout': 60, 'transaction_mode': 'IMMEDIATE'}}}
+CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+MEDIA_ROOT = os.path.join(BENCHMARK_DIR, 'media')
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+USE_TZ = True
+SITE_ID = 1
+AUTHENTICATION_BACKENDS = ('django.contrib.auth.backends.ModelBackend', 'guardian.backends.ObjectPermissionBackend')
+TARGET_TYPE = 'SIDEREAL'
+TARGET_PERMISSIONS_ONLY = True
+EXTRA_FIELDS = []
+HOOKS = {}
+AUTO_THUMBNAILS = False
+TOM_FACILITY_CLASSES = ['tom_mmt.mmt.MMTFacility']
+DATA_PRODUCT_TYPES = {
+    'spectroscopy': ('spectroscopy', 'Spectroscopy'),
+    'image_file': ('image_file', 'Image File'),
+    'MMT': ('MMT', 'MMT File'),
+}
+DATA_PROCESSORS = {
+    'spectroscopy': 'tom_dataproducts.processors.spectroscopy_processor.SpectroscopyProcessor',
+    'MMT': 'tom_mmt.mmt.MMTDataProcessor',
+}
+FACILITIES = {
+    'MMT': {
+        'programs': {
+            'Binospec': [('a' * 32, 'Benchmark Binospec Program')],
+            'MMIRS': [('b' * 32, 'Benchmark MMIRS Program')],
+        },
+        'api_url': os.environ['MMT_BENCHMARK_API_URL'],
+    },
+}
@@ -0,0 +1,54 @@
+from django.conf import settings
+from urllib.parse import urlsplit
+import threading
+import re
+
+DEFAULT_BASE_URL = 'https://scheduler.mmto.arizona.edu/APIv2'  # same as pymmt
+TOKEN_PATTERN = re.compile(r'(/token/)[^/\s\'"?]+')
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def endpoint_name(url):
+    """Name the API endpoint of a URL for metrics, leaving out IDs and tokens, e.g., data/download/datafile"""
+    segments = urlsplit(url).path.split('/')
+    if 'APIv2' in segments:
+        segments = segments[segments.index('APIv2') + 1:]
+    name = []
+    previous = None
+    for segment in segments:
+        if segment and not segment.isdigit() and 'token' not in (segment, previous):
+            name.append(segment)
+        previous = segment
+    return '/'.join(name)
+
+
+def redact(text):
+    """Replace the program API tokens in a URL or an error message, e.g., from requests, so that it can be logged"""
+    return TOKEN_PATTERN.sub(r'\1***', str(text))
+
+
+def get_session():
+    """
+    Return the connection-pooled session shared by all requests to the MMT API, creating it on first use
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                from tom_mmt.client import make_session  # imports requests only when it is needed
+                _session = make_session()
+    return _session
+
+
+def get_base_url():
+    return settings.FACILITIES['MMT'].get('api_url', DEFAULT_BASE_URL)
+
+
+def __getattr__(name):
+    # the pymmt client classes are loaded on first use, so that importing tom_mmt does not import pymmt
+    if name in ['Target', 'Datalist', 'Image']:
+        from tom_mmt import client
+        return getattr(client, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
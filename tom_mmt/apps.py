@@ -0,0 +1,6 @@
+from django.apps import AppConfig
+
+
+class TomMmtConfig(AppConfig):
+    name = 'tom_mmt'
+    default_auto_field = 'django.db.models.BigAutoField'
@@ -0,0 +1,86 @@
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from tom_mmt.api import get_session, get_base_url, endpoint_name
+from tom_mmt.metrics import metrics
+import requests
+import pymmt
+
+
+class MMTSession(requests.Session):
+    """Session that applies a default timeout to every request"""
+    def __init__(self, timeout=None):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        if not metrics.enabled:
+            return super().request(method, url, *args, **kwargs)
+        endpoint = endpoint_name(url)
+        with metrics.timer('api_request_seconds', endpoint=endpoint, method=method):
+            response = super().request(method, url, *args, **kwargs)
+        metrics.increment('api_responses', endpoint=endpoint, status=str(response.status_code))
+        return response
+
+
+class MMTRetry(Retry):
+    """Retry policy that counts each retry"""
+    def increment(self, method=None, url=None, *args, **kwargs):
+        if metrics.enabled:
+            metrics.increment('api_retries', endpoint=endpoint_name(url or ''))
+        return super().increment(method, url, *args, **kwargs)
+
+
+def make_session():
+    mmt_settings = settings.FACILITIES['MMT']
+    retry = MMTRetry(
+        total=mmt_settings.get('http_retries', 3),
+        backoff_factor=mmt_settings.get('http_backoff', 0.5),
+        status_forcelist=[429, 500, 502, 503, 504],  # only idempotent methods are retried
+        raise_on_status=False,  # return the last response, as pymmt expects
+    )
+    adapter = HTTPAdapter(pool_maxsize=mmt_settings.get('http_pool_size', 10), max_retries=retry)
+    session = MMTSession(timeout=mmt_settings.get('http_timeout', 60))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class SessionMixin:
+    # same as the request methods of pymmt.api, except that they use the shared session
+    def __init__(self, *args, base=None, verbose=False, **kwargs):
+        super().__init__(*args, base=base or get_base_url(), verbose=verbose, **kwargs)
+
+    def _get(self, r_json):
+        self._build_url(r_json['urlparams'])
+        self.request = get_session().get(self.url, json=r_json.get('d_json'))
+        return self.request
+
+    def _post(self, r_json):
+        self._build_url(r_json['urlparams'])
+        self.request = get_session().post(self.url, json=r_json.get('d_json'), data=r_json.get('data'),
+                                          files=r_json.get('files'))
+        return self.request
+
+    def _put(self, r_json):
+        self._build_url(r_json['urlparams'])
+        self.request = get_session().put(self.url, json=r_json['d_json'])
+        return self.request
+
+    def _delete(self, r_json):
+        self._build_url(r_json['urlparams'])
+        self.request = get_session().delete(self.url, json=r_json['d_json'])
+        return self.request
+
+
+class Target(SessionMixin, pymmt.Target):
+    pass
+
+
+class Datalist(SessionMixin, pymmt.Datalist):
+    pass
+
+
+class Image(SessionMixin, pymmt.Image):
+    pass
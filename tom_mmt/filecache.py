@@ -0,0 +1,136 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from tom_mmt.metrics import metrics
+from collections import defaultdict
+import threading
+import hashlib
+import shutil
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+_download_cache = None
+_download_cache_lock = threading.Lock()
+
+
+def file_checksum(file_info):
+    """
+    Checksum of a datafile listed by the MMT API, or a hash of its metadata if the API does not provide one, so that a
+    datafile that is reduced again gets a new checksum
+    """
+    for key in ['checksum', 'sha256', 'md5']:
+        if file_info.get(key):
+            return str(file_info[key])
+    metadata = {key: value for key, value in file_info.items() if key != 'url'}  # the URL contains the API token
+    return hashlib.sha256(json.dumps(metadata, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+
+class DownloadCache:
+    """
+    Directory of downloaded MMT datafiles, each named by its datafile ID and checksum. When the total size exceeds
+    max_size bytes, the least recently used files are removed.
+    """
+    def __init__(self, directory, max_size):
+        self.directory = os.path.abspath(directory)
+        self.max_size = max_size
+        self._locks = defaultdict(threading.Lock)
+        self._locks_lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, datafile_id, checksum):
+        return os.path.join(self.directory, f'{datafile_id}-{checksum}')
+
+    def touch(self, path):
+        # the last use is recorded on a separate marker file, because changing the mtime of the cached file would also
+        # change it for the data products hard linked to it
+        with open(path + '.used', 'a'):
+            os.utime(path + '.used')
+
+    def fetch(self, datafile_id, checksum, download):
+        """
+        Return the cached copy of a datafile as an open file, calling download() to get it as an open temporary file
+        if it is not already cached
+        """
+        path = self.path(datafile_id, checksum)
+        with self._locks_lock:
+            lock = self._locks[path]
+        with lock:  # other threads wait for the same file rather than downloading it again
+            try:
+                f = open(path, 'rb')
+                metrics.cache_lookup('download', True)
+            except FileNotFoundError:
+                metrics.cache_lookup('download', False)
+                with download() as tmpfile:
+                    tmpfile.flush()
+                    try:
+                        os.link(tmpfile.name, path)  # keep the temporary file after it is closed
+                    except FileExistsError:  # added by another process
+                        pass
+                    except OSError:  # on a different filesystem
+                        partial = f'{path}.{os.getpid()}.{threading.get_ident()}.partial'
+                        with open(partial, 'wb') as copy:
+                            tmpfile.seek(0)
+                            shutil.copyfileobj(tmpfile, copy)
+                        os.replace(partial, path)
+                    f = open(path, 'rb')
+            self.touch(path)
+        # the file is already open, so it can still be read if it is evicted
+        self.evict(keep=path)
+        return f
+
+    def evict(self, keep=None):
+        """Remove the least recently used files, other than keep, until the cache is no larger than max_size"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(('.partial', '.used')):
+                stat = entry.stat()
+                try:
+                    last_used = os.stat(entry.path + '.used').st_mtime
+                except FileNotFoundError:
+                    last_used = stat.st_mtime
+                entries.append((last_used, stat.st_size, entry.path))
+        total_size = sum(size for last_used, size, path in entries)
+        for last_used, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            if path == keep:
+                continue
+            for removed in [path, path + '.used']:
+                try:
+                    os.remove(removed)
+                except FileNotFoundError:
+                    pass
+            total_size -= size
+            logger.info('Removed {} from the MMT download cache'.format(os.path.basename(path)))
+
+    def link(self, data_product, path, filename):
+        """
+        Store a cached file as the data of a data product with a hard link instead of a copy, if the data product is
+        stored on the local filesystem. Returns False if the file must be copied instead.
+        """
+        storage = data_product.data.storage
+        if not isinstance(storage, FileSystemStorage) or os.path.dirname(os.path.abspath(path)) != self.directory:
+            return False
+        name = storage.get_available_name(data_product.data.field.generate_filename(data_product, filename))
+        os.makedirs(os.path.dirname(storage.path(name)), exist_ok=True)
+        try:
+            os.link(path, storage.path(name))
+        except OSError:  # on a different filesystem, or the cached file was just evicted
+            return False
+        data_product.data.name = name
+        data_product.save()
+        return True
+
+
+def get_download_cache():
+    """Return the download cache, or None if the download_cache_dir setting is not set"""
+    global _download_cache
+    directory = settings.FACILITIES['MMT'].get('download_cache_dir')
+    if directory and _download_cache is None:
+        with _download_cache_lock:
+            if _download_cache is None:
+                _download_cache = DownloadCache(directory,
+                                                settings.FACILITIES['MMT'].get('download_cache_size', 10 * 1024 ** 3))
+    return _download_cache if directory else None
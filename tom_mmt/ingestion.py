@@ -0,0 +1,129 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from tom_dataproducts.models import DataProduct
+from tom_mmt import api
+from tom_mmt.models import IngestionJob
+from tom_mmt.tokens import token_resolver
+from tom_mmt.metrics import metrics
+from tom_mmt.mmt import fetch_data_file, store_data_product, process_data_product
+from tom_mmt.filecache import file_checksum
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_jobs(observation_record, products):
+    """
+    Queue one ingestion job for each datafile that has not been ingested, and return the data products that already
+    have their files. The data products for the queued datafiles are created by the jobs once their files are stored.
+    """
+    # jobs that ran out of attempts get another chance each time the data are requested
+    IngestionJob.objects.filter(observation_record=observation_record, status=IngestionJob.FAILED) \
+        .update(status=IngestionJob.PENDING, attempts=0, modified=timezone.now())
+    existing_products = [dp for dp in DataProduct.objects.filter(observation_record=observation_record,
+                                                                 product_id__in=[str(product['id'])
+                                                                                 for product in products])
+                         if dp.data]
+    ingested_ids = {dp.product_id for dp in existing_products}
+    jobs = [IngestionJob(observation_record=observation_record, datafile_id=str(product['id']),
+                         filename=product['filename'], checksum=file_checksum(product))
+            for product in products if str(product['id']) not in ingested_ids]
+    IngestionJob.objects.bulk_create(jobs, ignore_conflicts=True)  # there is only ever one job per datafile
+    return existing_products
+
+
+def requeue_stale_jobs():
+    """Return jobs to the queue if their worker stopped without finishing them"""
+    timeout = settings.FACILITIES['MMT'].get('ingestion_timeout', 3600)
+    return IngestionJob.objects.filter(status=IngestionJob.RUNNING,
+                                       modified__lt=timezone.now() - timedelta(seconds=timeout)) \
+        .update(status=IngestionJob.PENDING, modified=timezone.now())
+
+
+def claim_job():
+    """Mark the oldest pending job as running and return it, or return None if there are no pending jobs"""
+    while True:
+        pks = list(IngestionJob.objects.filter(status=IngestionJob.PENDING).values_list('pk', flat=True)[:10])
+        if not pks:
+            return None
+        for pk in pks:
+            # only one worker can change the status from pending, so each job is claimed once
+            if IngestionJob.objects.filter(pk=pk, status=IngestionJob.PENDING).update(
+                    status=IngestionJob.RUNNING, attempts=F('attempts') + 1, modified=timezone.now()):
+                return IngestionJob.objects.select_related('observation_record__target', 'data_product').get(pk=pk)
+
+
+def run_job(job):
+    max_attempts = settings.FACILITIES['MMT'].get('ingestion_attempts', 3)
+    observation_record = job.observation_record
+    try:
+        if job.data_product is None:  # skip the download if an earlier attempt failed during processing
+            dp = DataProduct.objects.filter(product_id=job.datafile_id).first() or DataProduct(
+                product_id=job.datafile_id,
+                target=observation_record.target,
+                observation_record=observation_record,
+                data_product_type='MMT',
+            )
+            if not dp.data:
+                token = token_resolver.get(observation_record.observation_id)
+                image = api.Image(token=token)
+                image._build_url({'datafileid': job.datafile_id, 'token': token})
+                with fetch_data_file(job.datafile_id, job.checksum, image.url) as f:
+                    store_data_product(dp, f, job.filename)
+            job.data_product = dp
+            job.save(update_fields=['data_product', 'modified'])
+        process_data_product(job.data_product)
+    except Exception as e:
+        logger.error('Failed to ingest MMT data product {} (attempt {}): {}'
+                     .format(job.datafile_id, job.attempts, api.redact(e)))
+        job.status = IngestionJob.PENDING if job.attempts < max_attempts else IngestionJob.FAILED
+        job.error = api.redact(e)
+    else:
+        job.status = IngestionJob.COMPLETED
+        job.error = ''
+    job.save(update_fields=['status', 'error', 'modified'])
+    metrics.increment('ingestion_jobs', status=job.status)
+
+
+def run_workers(max_workers=None, once=False, stop=None):
+    """
+    Run pending ingestion jobs in a pool of worker threads. If once is True, return when the queue is empty.
+    Otherwise, keep polling for new jobs until the stop event is set.
+    """
+    max_workers = max_workers or settings.FACILITIES['MMT'].get('ingestion_workers', 4)
+    poll_interval = settings.FACILITIES['MMT'].get('ingestion_poll_interval', 10)
+    stop = stop or threading.Event()
+    requeue_stale_jobs()
+
+    def work():
+        try:
+            while not stop.is_set():
+                job = claim_job()
+                if job is not None:
+                    try:
+                        run_job(job)
+                    except Exception as e:  # the job stays running until it is requeued as stale
+                        logger.error('Failed to update MMT ingestion job {}: {}'.format(job.datafile_id, e))
+                elif once:
+                    break
+                else:
+                    # jobs left running by workers in other processes that stopped are picked up without a restart
+                    requeue_stale_jobs()
+                    stop.wait(poll_interval)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='mmt-ingestion') as executor:
+        futures = [executor.submit(work) for _ in range(max_workers)]
+        try:
+            for future in futures:
+                future.result()
+        except KeyboardInterrupt:
+            logger.info('Stopping MMT ingestion workers after their current jobs')
+            stop.set()
+            raise
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from tom_mmt.ingestion import run_workers
+from tom_mmt.models import IngestionJob
+
+
+class Command(BaseCommand):
+    help = 'Downloads and processes MMT data products queued by deferred ingestion'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            required=False,
+            help='Number of jobs to run at once (default: the ingestion_workers setting)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit when there are no pending jobs instead of waiting for new ones'
+        )
+
+    def handle(self, *args, **options):
+        run_workers(max_workers=options.get('workers'), once=options['once'])
+        failed = IngestionJob.objects.filter(status=IngestionJob.FAILED).count()
+        pending = IngestionJob.objects.filter(status=IngestionJob.PENDING).count()
+        return f'{pending} jobs pending, {failed} jobs failed'
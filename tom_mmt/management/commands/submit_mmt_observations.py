@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from tom_targets.models import Target
+from tom_mmt.mmt import MMTFacility
+import json
+
+
+class Command(BaseCommand):
+    help = 'Submits many MMT observation requests at once from a JSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'requests_file',
+            help='JSON file containing a list of requests, each like {"target": "name or id", '
+                 '"observation_type": "BINOSPEC_SPECTROSCOPY", "parameters": {"program": "...", ...}}. '
+                 'Finder charts are given as file paths.'
+        )
+        parser.add_argument(
+            '--username',
+            required=False,
+            help='The username of the user who will own the new observation records'
+        )
+        parser.add_argument(
+            '--min-observable-hours',
+            type=float,
+            required=False,
+            help='Skip requests whose targets are below the airmass limit for fewer than this many hours tonight'
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options.get('username'):
+            try:
+                user = User.objects.get(username=options['username'])
+            except User.DoesNotExist:
+                raise CommandError('Invalid username provided')
+
+        with open(options['requests_file']) as f:
+            requests = json.load(f)
+
+        # look up all the targets in one query
+        names = {str(request['target']) for request in requests}
+        targets = {target.name: target for target in Target.objects.filter(name__in=names)}
+        targets.update({str(target.id): target for target in
+                        Target.objects.filter(pk__in=[name for name in names if name.isdigit()])})
+        missing = names - set(targets)
+        if missing:
+            raise CommandError('Targets not found: {}'.format(', '.join(sorted(missing))))
+
+        observation_requests = [(targets[str(request['target'])], request['observation_type'], request['parameters'])
+                                for request in requests]
+        facility = MMTFacility()
+        if options.get('min_observable_hours') is not None:
+            observable = {observability['target'].id for observability in facility.rank_targets(
+                set(targets.values()), min_hours=options['min_observable_hours'])}
+            for target, observation_type, parameters in observation_requests:
+                if target.id not in observable:
+                    self.stdout.write(f'{target.name}: skipped, not observable tonight')
+            observation_requests = [request for request in observation_requests if request[0].id in observable]
+        results = facility.submit_observations(observation_requests, user=user)
+
+        failures = 0
+        for result in results:
+            if result['record'] is not None:
+                self.stdout.write(f"{result['target'].name}: submitted as {result['record'].observation_id}")
+            else:
+                failures += 1
+                self.stderr.write(f"{result['target'].name}: {json.dumps(result['errors'])}")
+        return f'{len(results) - failures} of {len(results)} observations submitted'
@@ -0,0 +1,209 @@
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, Http404
+from django.utils.module_loading import import_string
+from collections import defaultdict
+from contextlib import contextmanager
+from bisect import bisect_left
+import functools
+import threading
+import socket
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60., 300.)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class MetricsHook:
+    """
+    Receives every metric recorded by tom_mmt. Counters are incremented by value, and observations are added to a
+    histogram. Names ending in _seconds are durations. Tags are a dictionary of strings that label the metric.
+    """
+    def increment(self, name, value, tags):
+        pass
+
+    def observe(self, name, value, tags):
+        pass
+
+
+class LoggingHook(MetricsHook):
+    """Logs every metric to the tom_mmt.metrics logger at DEBUG level"""
+    def increment(self, name, value, tags):
+        logger.debug('{} +{} {}'.format(name, value, tags))
+
+    def observe(self, name, value, tags):
+        logger.debug('{} {} {}'.format(name, value, tags))
+
+
+class StatsdHook(MetricsHook):
+    """Sends every metric to a statsd server over UDP, with the tag values appended to the metric name"""
+    def __init__(self):
+        mmt_settings = settings.FACILITIES['MMT']
+        self.address = (mmt_settings.get('statsd_host', 'localhost'), mmt_settings.get('statsd_port', 8125))
+        self.prefix = mmt_settings.get('statsd_prefix', 'tom_mmt')
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _send(self, name, value, metric_type, tags):
+        name = '.'.join([self.prefix, name] + [str(tag).replace('.', '_') for tag in tags.values()])
+        try:
+            self.socket.sendto(f'{name}:{value}|{metric_type}'.encode(), self.address)
+        except OSError as e:  # metrics must never break the code being measured
+            logger.debug('Failed to send metric to statsd: {}'.format(e))
+
+    def increment(self, name, value, tags):
+        self._send(name, value, 'c', tags)
+
+    def observe(self, name, value, tags):
+        if name.endswith('_seconds'):
+            self._send(name[:-len('_seconds')], round(value * 1000., 3), 'ms', tags)
+        else:
+            self._send(name, value, 'h', tags)
+
+
+class PrometheusHook(MetricsHook):
+    """
+    Accumulates every metric in memory and renders them in the Prometheus text format, which is served by the
+    prometheus_metrics view. Each process keeps its own totals.
+    """
+    def __init__(self):
+        self.prefix = settings.FACILITIES['MMT'].get('prometheus_prefix', 'tom_mmt')
+        self.counters = defaultdict(int)
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def increment(self, name, value, tags):
+        with self.lock:
+            self.counters[name, tuple(tags.items())] += value
+
+    def observe(self, name, value, tags):
+        buckets = SECONDS_BUCKETS if name.endswith('_seconds') else COUNT_BUCKETS
+        with self.lock:
+            key = (name, tuple(tags.items()))
+            if key not in self.histograms:
+                self.histograms[key] = {'buckets': [0] * (len(buckets) + 1), 'sum': 0., 'count': 0}
+            histogram = self.histograms[key]
+            histogram['buckets'][bisect_left(buckets, value)] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    @staticmethod
+    def _labels(tags, **extra):
+        labels = ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for key, value in list(tags) + list(extra.items()))
+        return '{' + labels + '}' if labels else ''
+
+    def render(self):
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, dict(value, buckets=list(value['buckets'])))
+                                for key, value in self.histograms.items())
+        last_name = None
+        for (name, tags), value in counters:
+            name = f'{self.prefix}_{name}_total'
+            if name != last_name:
+                lines.append(f'# TYPE {name} counter')
+                last_name = name
+            lines.append(f'{name}{self._labels(tags)} {value}')
+        for (name, tags), histogram in histograms:
+            buckets = SECONDS_BUCKETS if name.endswith('_seconds') else COUNT_BUCKETS
+            name = f'{self.prefix}_{name}'
+            if name != last_name:
+                lines.append(f'# TYPE {name} histogram')
+                last_name = name
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], histogram['buckets']):
+                cumulative += count
+                lines.append(f'{name}_bucket{self._labels(tags, le=bound)} {cumulative}')
+            lines.append(f"{name}_sum{self._labels(tags)} {histogram['sum']:g}")
+            lines.append(f"{name}_count{self._labels(tags)} {histogram['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+class Metrics:
+    """
+    Records metrics by passing them to the hooks listed in the metrics_hooks setting, which are loaded on first use.
+    When no hooks are configured, recording a metric does nothing.
+    """
+    def __init__(self):
+        self._hooks = None
+        self._lock = threading.Lock()
+
+    @property
+    def hooks(self):
+        if self._hooks is None:
+            with self._lock:
+                if self._hooks is None:
+                    self._hooks = [import_string(path)() for path in
+                                   settings.FACILITIES['MMT'].get('metrics_hooks', [])]
+        return self._hooks
+
+    @property
+    def enabled(self):
+        return bool(self.hooks)
+
+    def increment(self, name, value=1, **tags):
+        for hook in self.hooks:
+            hook.increment(name, value, tags)
+
+    def observe(self, name, value, **tags):
+        for hook in self.hooks:
+            hook.observe(name, value, tags)
+
+    @contextmanager
+    def timer(self, name, **tags):
+        if not self.hooks:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **tags)
+
+    def cache_lookup(self, cache_name, hit):
+        if self.hooks:
+            self.increment('cache_hits' if hit else 'cache_misses', cache=cache_name)
+
+    def instrument(self, func):
+        """
+        Decorator that records the duration, the number of database queries made by the calling thread, and any
+        errors of each call to func
+        """
+        method = func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.hooks:
+                return func(*args, **kwargs)
+            queries = [0]
+
+            def count_query(execute, *query_args):
+                queries[0] += 1
+                return execute(*query_args)
+
+            start = time.perf_counter()
+            try:
+                with connection.execute_wrapper(count_query):
+                    return func(*args, **kwargs)
+            except Exception:
+                self.increment('call_errors', method=method)
+                raise
+            finally:
+                self.observe('call_seconds', time.perf_counter() - start, method=method)
+                self.observe('db_queries', queries[0], method=method)
+        return wrapper
+
+
+metrics = Metrics()
+
+
+def prometheus_metrics(request):
+    """View that serves the metrics accumulated by PrometheusHook in this process"""
+    hooks = [hook for hook in metrics.hooks if isinstance(hook, PrometheusHook)]
+    if not hooks:
+        raise Http404('PrometheusHook is not configured')
+    return HttpResponse(''.join(hook.render() for hook in hooks), content_type='text/plain; version=0.0.4')
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_mmt', '0002_ingestionjob_checksum'),
+        ('tom_observations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PollSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('next_poll', models.DateTimeField(db_index=True)),
+                ('interval', models.FloatField()),
+                ('last_polled', models.DateTimeField(blank=True, null=True)),
+                ('observation_record', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='mmt_poll_schedule', to='tom_observations.observationrecord')),
+            ],
+        ),
+    ]
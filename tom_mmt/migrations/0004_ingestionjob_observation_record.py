@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def set_observation_records(apps, schema_editor):
+    # jobs that have not stored their files no longer keep an empty data product
+    IngestionJob = apps.get_model('tom_mmt', 'IngestionJob')
+    DataProduct = apps.get_model('tom_dataproducts', 'DataProduct')
+    empty_data_products = []
+    for job in IngestionJob.objects.select_related('data_product'):
+        job.observation_record_id = job.data_product.observation_record_id
+        if not job.data_product.data:
+            empty_data_products.append(job.data_product_id)
+            job.data_product = None
+        job.save(update_fields=['observation_record', 'data_product'])
+    IngestionJob.objects.filter(observation_record=None).delete()
+    DataProduct.objects.filter(pk__in=empty_data_products).delete()
+
+
+def delete_jobs_without_data_products(apps, schema_editor):
+    # earlier versions require a data product for each job
+    IngestionJob = apps.get_model('tom_mmt', 'IngestionJob')
+    IngestionJob.objects.filter(data_product=None).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_dataproducts', '0001_initial'),
+        ('tom_mmt', '0003_pollschedule'),
+        ('tom_observations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='observation_record',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='mmt_ingestion_jobs', to='tom_observations.observationrecord'),
+        ),
+        migrations.AlterField(
+            model_name='ingestionjob',
+            name='data_product',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='mmt_ingestion_job', to='tom_dataproducts.dataproduct'),
+        ),
+        migrations.RunPython(set_observation_records, delete_jobs_without_data_products),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_mmt', '0004_ingestionjob_observation_record'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingestionjob',
+            name='observation_record',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mmt_ingestion_jobs', to='tom_observations.observationrecord'),
+        ),
+        migrations.AlterField(
+            model_name='ingestionjob',
+            name='datafile_id',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name='ingestionjob',
+            constraint=models.UniqueConstraint(fields=('observation_record', 'datafile_id'), name='unique_mmt_ingestion_job'),
+        ),
+    ]
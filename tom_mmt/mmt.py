@@ -2,26 +2,184 @@ from tom_observations.facility import BaseRoboticObservationForm, BaseRoboticObs
 from tom_observations.models import ObservationRecord
 from tom_dataproducts.data_processor import run_data_processor, DataProcessor
 from tom_dataproducts.models import DataProduct
-from tom_dataproducts.utils import create_image_dataproduct
 from tom_targets.models import Target
-from astropy.coordinates import SkyCoord
 from django import forms
-from django.core.files.base import ContentFile
-from crispy_forms.layout import Layout, Row, Column
-from crispy_forms.bootstrap import AppendedText
-import pymmt
+from django.core.files.base import File
+from tom_mmt import api
+from tom_mmt.api import get_session
+from tom_mmt.schedule import get_schedule
+from tom_mmt.tokens import token_resolver
+from tom_mmt.metrics import metrics
+from tom_mmt.thumbnails import update_thumbnails
+from tom_mmt.spectra import ingest_spectra
+from tom_mmt.filecache import get_download_cache, file_checksum
+from tom_mmt.observability import get_night, julian_date_to_datetime
 from django.conf import settings
-import requests
-from datetime import datetime
+from django.db import connection, transaction
+import django
+from django.core.cache import cache
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import math
 import re
+import json
+import hashlib
 import mimetypes
-from tarfile import TarFile
+import tarfile
+import multiprocessing
+from tempfile import NamedTemporaryFile
 import os
+import time
+import threading
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def download_file(datafile_id, url):
+    """
+    Stream a file into a temporary file in fixed-size chunks, resuming with a ranged request if the transfer is
+    interrupted. The returned file is rewound and is deleted when closed.
+    """
+    import requests
+    chunk_size = settings.FACILITIES['MMT'].get('download_chunk_size', 64 * 1024)
+    retries = settings.FACILITIES['MMT'].get('download_retries', 3)
+    tmpfile = NamedTemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR)
+    for attempt in range(retries + 1):
+        headers = {'Range': f'bytes={tmpfile.tell()}-'} if tmpfile.tell() else {}
+        try:
+            with get_session().get(url, headers=headers, stream=True) as response:
+                response.raise_for_status()
+                if headers and response.status_code != 206:  # server ignored the range, so start over
+                    tmpfile.seek(0)
+                    tmpfile.truncate()
+                for chunk in response.iter_content(chunk_size):
+                    tmpfile.write(chunk)
+            break
+        except requests.RequestException as e:
+            if attempt == retries:
+                tmpfile.close()
+                raise
+            metrics.increment('download_retries')
+            logger.warning('Download of MMT datafile {} interrupted at {} bytes, retrying: {}'
+                           .format(datafile_id, tmpfile.tell(), api.redact(e)))
+            time.sleep(2 ** attempt)
+    metrics.increment('download_bytes', tmpfile.tell())
+    tmpfile.seek(0)
+    return tmpfile
+
+
+def _run_data_processor(data_product_id):
+    data_product = DataProduct.objects.get(pk=data_product_id)
+    try:
+        with metrics.timer('data_processor_seconds'):
+            run_data_processor(data_product)
+    except Exception as e:  # log each failure rather than aborting the remaining files
+        logger.error('Failed to process data product {}: {}'.format(data_product, e))
+
+
+def run_data_processors(data_products):
+    """
+    Run the data processor on each data product, in a pool of worker processes if processor_workers is more than one.
+    Each worker sets up Django, so the pool only pays off when the processor is much slower than that, and a script
+    that runs it must guard its entry point with if __name__ == '__main__'.
+    """
+    max_workers = settings.FACILITIES['MMT'].get('processor_workers', 1)
+    # worker processes cannot see rows created inside an uncommitted transaction
+    if len(data_products) < 2 or max_workers < 2 or connection.in_atomic_block:
+        for data_product in data_products:
+            _run_data_processor(data_product.pk)
+        return
+    mp_context = multiprocessing.get_context('spawn')  # forking is unsafe while other threads are running
+    with ProcessPoolExecutor(max_workers, mp_context=mp_context, initializer=django.setup) as executor:
+        list(executor.map(_run_data_processor, [data_product.pk for data_product in data_products]))
+
+
+def fetch_data_file(datafile_id, checksum, url):
+    """Return an open file with the contents of a datafile, from the download cache if it is enabled"""
+    download_cache = get_download_cache()
+    if download_cache is None:
+        return download_file(datafile_id, url)
+    return download_cache.fetch(datafile_id, checksum, lambda: download_file(datafile_id, url))
+
+
+def store_data_product(data_product, f, filename):
+    with metrics.timer('storage_write_seconds'):
+        download_cache = get_download_cache()
+        if download_cache is None or not download_cache.link(data_product, f.name, filename):
+            data_product.data.save(filename, File(f))
+    logger.info('Saved new dataproduct: {}'.format(data_product.data))
+
+
+def process_data_product(data_product):
+    with metrics.timer('data_processor_seconds'):
+        run_data_processor(data_product)
+    if settings.AUTO_THUMBNAILS:
+        update_thumbnails(data_product)
+
+
+class LazyFile(File):
+    """File given by a path, which is only opened when it is read"""
+    def __init__(self, path):
+        super().__init__(None, os.path.basename(path))
+        self.path = path
+        self.size = os.path.getsize(path)
+
+    def open(self, mode='rb'):
+        if self.file is None or self.file.closed:
+            self.file = open(self.path, mode)
+        else:
+            self.seek(0)
+        return self
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class RateLimiter:
+    """Allows at most one call to wait() to return every interval seconds, across all threads"""
+    def __init__(self, interval):
+        self.interval = interval
+        self.next_time = 0.
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+OBJECTID_INVALID_CHARACTERS = re.compile('[^a-zA-Z0-9]')  # only alphanumeric characters allowed
+
+
+def target_payload_fields(targets):
+    """Return the (objectid, ra, dec) payload fields for each target, converting all of the coordinates at once"""
+    from astropy.coordinates import SkyCoord  # slow to import, so only when a form is validated
+    coords = SkyCoord([target.ra for target in targets], [target.dec for target in targets], unit='deg')
+    radecs = coords.to_string('hmsdms', sep=':', precision=1)
+    return [(OBJECTID_INVALID_CHARACTERS.sub('', target.name), *radec.split())
+            for target, radec in zip(targets, radecs)]
+
+
+def payload_hash(observation_payload):
+    # the finder chart is uploaded separately after the target is created, so it does not affect validation
+    payload = {key: value for key, value in observation_payload.items() if key != 'finder_chart'}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+# program choices are read from the settings when a form is created, rather than when this module is imported
+def binospec_programs():
+    return settings.FACILITIES['MMT']['programs']['Binospec']
+
+
+def mmirs_programs():
+    return settings.FACILITIES['MMT']['programs']['MMIRS']
+
+
 class MMTBaseObservationForm(BaseRoboticObservationForm):
     magnitude = forms.FloatField()
     visits = forms.IntegerField(initial=1, min_value=1)
@@ -33,22 +191,65 @@ class MMTBaseObservationForm(BaseRoboticObservationForm):
     ], initial=(1, 'high'))
     target_of_opportunity = forms.BooleanField(initial=True)
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._target_fields = {}
+
+    def get_target_fields(self):
+        # observation_payload is called by is_valid and again on submission, so only look up the target once
+        target_id = self.cleaned_data['target_id']
+        if target_id not in self._target_fields:
+            self._target_fields[target_id] = target_payload_fields([Target.objects.get(pk=target_id)])[0]
+        return self._target_fields[target_id]
+
+    def observation_payload(self):
+        return self.build_payload(*self.get_target_fields())
+
+    def observation_payloads(self, target_ids):
+        """
+        Build the payloads for many targets with the parameters in this form, fetching the targets in one query and
+        converting all their coordinates at once
+        """
+        targets = Target.objects.in_bulk(target_ids)
+        return [self.build_payload(*fields) for fields in target_payload_fields([targets[pk] for pk in target_ids])]
+
+    def build_payload(self, objectid, ra, dec):
+        # fields common to all instruments and observation types
+        return {
+            'objectid': objectid,
+            'ra': ra,
+            'dec': dec,
+            'epoch': 'J2000',
+            'instrumentid': self.instrumentid,
+            'magnitude': self.cleaned_data['magnitude'],
+            'visits': self.cleaned_data['visits'],
+            'exposuretime': self.cleaned_data['exposure_time'],
+            'numberexposures': self.cleaned_data['number_of_exposures'],
+            'priority': self.cleaned_data['priority'],
+            'program': self.cleaned_data['program'],
+            'notes': self.cleaned_data['notes'],
+            'targetofopportunity': self.cleaned_data['target_of_opportunity'],
+        }
+
     def is_valid(self):
         self.full_clean()
-        facility = MMTFacility()
-        observation_payload = self.observation_payload()
-        errors = facility.validate_observation(observation_payload)
-        if errors:
-            self.add_error(None, errors)
+        if not self.errors:  # the payload cannot be built unless the fields themselves are valid
+            facility = MMTFacility()
+            observation_payload = self.observation_payload()
+            errors = facility.validate_observation(observation_payload)
+            if errors:
+                self.add_error(None, errors)
         return super().is_valid()
 
 
 class MMTBinospecObservationForm(MMTBaseObservationForm):
-    program = forms.ChoiceField(choices=settings.FACILITIES['MMT']['programs']['Binospec'])
+    instrumentid = 16
+    program = forms.ChoiceField(choices=binospec_programs)
 
 
 class MMTMMIRSObservationForm(MMTBaseObservationForm):
-    program = forms.ChoiceField(choices=settings.FACILITIES['MMT']['programs']['MMIRS'])
+    instrumentid = 15
+    program = forms.ChoiceField(choices=mmirs_programs)
 
 
 class MMTBinospecImagingForm(MMTBinospecObservationForm):
@@ -57,6 +258,8 @@ class MMTBinospecImagingForm(MMTBinospecObservationForm):
     number_of_exposures = forms.IntegerField(initial=5, min_value=1)
 
     def layout(self):
+        from crispy_forms.layout import Layout, Row, Column
+        from crispy_forms.bootstrap import AppendedText
         return Layout(
             Row(Column('magnitude'), Column(AppendedText('exposure_time', 's')), Column('filter')),
             Row(Column('visits'), Column('number_of_exposures'), Column('priority')),
@@ -65,27 +268,13 @@ class MMTBinospecImagingForm(MMTBinospecObservationForm):
             Row(Column('notes')),
         )
 
-    def observation_payload(self):
-        target = Target.objects.get(pk=self.cleaned_data['target_id'])
-        ra, dec = SkyCoord(target.ra, target.dec, unit='deg').to_string('hmsdms', sep=':', precision=1).split()
-        payload = {
+    def build_payload(self, objectid, ra, dec):
+        payload = super().build_payload(objectid, ra, dec)
+        payload.update({
             'observationtype': 'imaging',
-            'objectid': re.sub('[^a-zA-Z0-9]', '', target.name),  # only alphanumeric characters allowed
-            'ra': ra,
-            'dec': dec,
-            'epoch': 'J2000',
-            'instrumentid': 16,
-            'magnitude': self.cleaned_data['magnitude'],
             'maskid': 110,
             'filter': self.cleaned_data['filter'],
-            'visits': self.cleaned_data['visits'],
-            'exposuretime': self.cleaned_data['exposure_time'],
-            'numberexposures': self.cleaned_data['number_of_exposures'],
-            'priority': self.cleaned_data['priority'],
-            'program': self.cleaned_data['program'],
-            'notes': self.cleaned_data['notes'],
-            'targetofopportunity': self.cleaned_data['target_of_opportunity'],
-        }
+        })
         return payload
 
 
@@ -105,6 +294,8 @@ class MMTMMIRSImagingForm(MMTMMIRSObservationForm):
     number_of_exposures = forms.IntegerField(initial=2, min_value=1)
 
     def layout(self):
+        from crispy_forms.layout import Layout, Row, Column
+        from crispy_forms.bootstrap import AppendedText
         return Layout(
             Row(Column('magnitude'), Column(AppendedText('exposure_time', 's')), Column('filter')),
             Row(Column('gain'), Column('read_tab'), Column(AppendedText('dither_size', 'arcsec'))),
@@ -114,30 +305,16 @@ class MMTMMIRSImagingForm(MMTMMIRSObservationForm):
             Row(Column('notes')),
         )
 
-    def observation_payload(self):
-        target = Target.objects.get(pk=self.cleaned_data['target_id'])
-        ra, dec = SkyCoord(target.ra, target.dec, unit='deg').to_string('hmsdms', sep=':', precision=1).split()
-        payload = {
+    def build_payload(self, objectid, ra, dec):
+        payload = super().build_payload(objectid, ra, dec)
+        payload.update({
             'observationtype': 'imaging',
-            'objectid': re.sub('[^a-zA-Z0-9]', '', target.name),  # only alphanumeric characters allowed
-            'ra': ra,
-            'dec': dec,
-            'epoch': 'J2000',
-            'instrumentid': 15,
-            'magnitude': self.cleaned_data['magnitude'],
             'maskid': 110,
             'filter': self.cleaned_data['filter'],
-            'visits': self.cleaned_data['visits'],
-            'exposuretime': self.cleaned_data['exposure_time'],
-            'numberexposures': self.cleaned_data['number_of_exposures'],
-            'priority': self.cleaned_data['priority'],
-            'program': self.cleaned_data['program'],
             'gain': self.cleaned_data['gain'],
             'ReadTab': self.cleaned_data['read_tab'],
             'DitherSize': self.cleaned_data['dither_size'],
-            'notes': self.cleaned_data['notes'],
-            'targetofopportunity': self.cleaned_data['target_of_opportunity'],
-        }
+        })
         return payload
 
 
@@ -157,6 +334,8 @@ class MMTBinospecSpectroscopyForm(MMTBinospecObservationForm):
     finder_chart = forms.FileField()
 
     def layout(self):
+        from crispy_forms.layout import Layout, Row, Column
+        from crispy_forms.bootstrap import AppendedText
         return Layout(
             Row(
                 Column('magnitude'),
@@ -174,9 +353,7 @@ class MMTBinospecSpectroscopyForm(MMTBinospecObservationForm):
             Row(Column('notes')),
         )
 
-    def observation_payload(self):
-        target = Target.objects.get(pk=self.cleaned_data['target_id'])
-        ra, dec = SkyCoord(target.ra, target.dec, unit='deg').to_string('hmsdms', sep=':', precision=1).split()
+    def build_payload(self, objectid, ra, dec):
         maskid = {
             'Longslit0_75': 113,
             'Longslit1': 111,
@@ -184,28 +361,16 @@ class MMTBinospecSpectroscopyForm(MMTBinospecObservationForm):
             'Longslit1_5': 114,
             'Longslit5': 121,
         }.get(self.cleaned_data['slit_width'])
-        payload = {
+        payload = super().build_payload(objectid, ra, dec)
+        payload.update({
             'observationtype': 'longslit',
-            'objectid': re.sub('[^a-zA-Z0-9]', '', target.name),  # only alphanumeric characters allowed
-            'ra': ra,
-            'dec': dec,
-            'epoch': 'J2000',
-            'instrumentid': 16,
-            'magnitude': self.cleaned_data['magnitude'],
             'grating': self.cleaned_data['grating'],
             'centralwavelength': self.cleaned_data['central_wavelength'],
             'slitwidth': self.cleaned_data['slit_width'],
             'maskid': maskid,
             'filter': self.cleaned_data['filter'],
-            'visits': self.cleaned_data['visits'],
-            'notes': self.cleaned_data['notes'],
-            'exposuretime': self.cleaned_data['exposure_time'],
-            'numberexposures': self.cleaned_data['number_of_exposures'],
-            'priority': self.cleaned_data['priority'],
-            'targetofopportunity': self.cleaned_data['target_of_opportunity'],
             'finder_chart': self.cleaned_data['finder_chart'],
-            'program': self.cleaned_data['program'],
-        }
+        })
         return payload
 
     def serialize_parameters(self) -> dict:
@@ -244,6 +409,8 @@ class MMTMMIRSSpectroscopyForm(MMTMMIRSObservationForm):
     number_of_exposures = forms.IntegerField(initial=4, min_value=1)
 
     def layout(self):
+        from crispy_forms.layout import Layout, Row, Column
+        from crispy_forms.bootstrap import AppendedText
         return Layout(
             Row(
                 Column('magnitude'),
@@ -258,19 +425,11 @@ class MMTMMIRSSpectroscopyForm(MMTMMIRSObservationForm):
             Row(Column('notes')),
         )
 
-    def observation_payload(self):
-        target = Target.objects.get(pk=self.cleaned_data['target_id'])
-        ra, dec = SkyCoord(target.ra, target.dec, unit='deg').to_string('hmsdms', sep=':', precision=1).split()
+    def build_payload(self, objectid, ra, dec):
         grism, filter = self.cleaned_data['grism'].split('+')
-        payload = {
+        payload = super().build_payload(objectid, ra, dec)
+        payload.update({
             'observationtype': 'longslit',
-            'objectid': re.sub('[^a-zA-Z0-9]', '', target.name),  # only alphanumeric characters allowed
-            'ra': ra,
-            'dec': dec,
-            'epoch': 'J2000',
-            'instrumentid': 15,
-            'magnitude': self.cleaned_data['magnitude'],
-            'notes': self.cleaned_data['notes'],
             'gain': self.cleaned_data['gain'],
             'ReadTab': self.cleaned_data['read_tab'],
             'DitherSize': self.cleaned_data['dither_size'],
@@ -278,15 +437,9 @@ class MMTMMIRSSpectroscopyForm(MMTMMIRSObservationForm):
             'slitwidth': self.cleaned_data['slit_width'],
             'maskid': 111,
             'filter': filter,
-            'visits': self.cleaned_data['visits'],
-            'exposuretime': self.cleaned_data['exposure_time'],
-            'numberexposures': self.cleaned_data['number_of_exposures'],
-            'priority': self.cleaned_data['priority'],
-            'targetofopportunity': self.cleaned_data['target_of_opportunity'],
             'finder_chart': self.cleaned_data['finder_chart'],
             'slitwidthproperty': 'long',
-            'program': self.cleaned_data['program'],
-        }
+        })
         return payload
 
     def serialize_parameters(self) -> dict:
@@ -312,55 +465,158 @@ class MMTFacility(BaseRoboticObservationFacility):
         },
     }
 
-    def data_products(self, observation_id, product_id=None):
-        token = ObservationRecord.objects.get(observation_id=observation_id).parameters.get('program')
-        datalist = pymmt.Datalist(token=token)
-        datalist.get(targetid=observation_id, data_type='reduced')
+    @metrics.instrument
+    def data_products(self, observation_id, product_id=None, exclude_ids=()):
+        token = token_resolver.get(observation_id)
+        image = api.Image(token=token)
 
         # flatten the dictionary structure across all data sets
         data_products = []
-        for datalist in datalist.data:
+        for datalist in self._get_datalist(token, observation_id):
             for file_info in datalist['datafiles']:
-                image = pymmt.Image(token=token)
-                image._build_url({'datafileid': file_info['id'], 'token': token})
-                file_info['url'] = image.url
+                if str(file_info['id']) in exclude_ids:  # already ingested
+                    continue
                 if product_id is None or file_info['id'] == int(product_id):  # None means get all of them
+                    image._build_url({'datafileid': file_info['id'], 'token': token})
+                    file_info['url'] = image.url
                     data_products.append(file_info)
 
         return data_products
 
+    def _get_datalist(self, token, observation_id):
+        cache_key = f'mmt_datalist_{observation_id}'
+        datalist_data = cache.get(cache_key)
+        metrics.cache_lookup('datalist', datalist_data is not None)
+        if datalist_data is None:
+            datalist = api.Datalist(token=token)
+            datalist.get(targetid=observation_id, data_type='reduced')
+            datalist_data = datalist.data
+            if datalist.request.ok:
+                cache.set(cache_key, datalist_data, settings.FACILITIES['MMT'].get('datalist_cache_ttl', 300))
+        return datalist_data
+
+    @metrics.instrument
     def save_data_products(self, observation_record, product_id=None):
-        final_products = []
-        products = self.data_products(observation_record.observation_id, product_id)
+        if settings.FACILITIES['MMT'].get('incremental_sync', True) and product_id is None:
+            # skip files that were ingested by a previous sync before building any URLs or querying each one, but
+            # still return a single requested product that already exists
+            ingested_ids = set(DataProduct.objects.filter(observation_record=observation_record,
+                                                          data_product_type='MMT')
+                               .exclude(data='').exclude(data=None).values_list('product_id', flat=True))
+        else:
+            ingested_ids = set()
+        products = self.data_products(observation_record.observation_id, product_id, exclude_ids=ingested_ids)
+
+        if settings.FACILITIES['MMT'].get('deferred_ingestion', False):
+            # imported here because tom_mmt.models requires tom_mmt in INSTALLED_APPS, which is otherwise optional
+            from tom_mmt.ingestion import enqueue_jobs
+            return enqueue_jobs(observation_record, products)
 
+        existing_products = {dp.product_id: dp for dp in DataProduct.objects.filter(
+            product_id__in=[str(product['id']) for product in products])}
+        new_products = []
         for product in products:
-            dp, created = DataProduct.objects.get_or_create(
-                product_id=product['id'],
-                target=observation_record.target,
-                observation_record=observation_record,
-                data_product_type='MMT',  # same as the built-in method except for this line
-            )
-            if created:
-                product_data = requests.get(product['url']).content
-                dfile = ContentFile(product_data)
-                dp.data.save(product['filename'], dfile)
-                dp.save()
-                logger.info('Saved new dataproduct: {}'.format(dp.data))
-                run_data_processor(dp)
-            if settings.AUTO_THUMBNAILS:
-                create_image_dataproduct(dp)
-                dp.get_preview()
-            final_products.append(dp)
+            dp = existing_products.get(str(product['id']))
+            if dp is None:
+                # an unsaved data product is inserted when its file is stored, so that it is never seen without one
+                dp = DataProduct(
+                    product_id=product['id'],
+                    target=observation_record.target,
+                    observation_record=observation_record,
+                    data_product_type='MMT',  # same as the built-in method except for this line
+                )
+            new_products.append((dp, product, not dp.data))
+
+        final_products = []
+        with ThreadPoolExecutor(max_workers=settings.FACILITIES['MMT'].get('download_workers', 4)) as executor:
+            # start all the downloads first so they run while earlier files are being saved and processed
+            downloads = [executor.submit(fetch_data_file, product['id'], file_checksum(product), product['url'])
+                         if created else None
+                         for dp, product, created in new_products]
+            for (dp, product, created), download in zip(new_products, downloads):
+                if created:
+                    try:
+                        with download.result() as tmpfile:
+                            store_data_product(dp, tmpfile, product['filename'])
+                    except Exception as e:  # not saved, so it is retried on the next sync
+                        logger.error('Failed to download MMT data product {}: {}'.format(product['id'], api.redact(e)))
+                        continue
+                    try:
+                        process_data_product(dp)
+                    except Exception as e:
+                        logger.error('Failed to process MMT data product {}: {}'.format(product['id'], e))
+                elif settings.AUTO_THUMBNAILS:  # skipped if the file has not changed since its thumbnails were made
+                    update_thumbnails(dp)
+                final_products.append(dp)
         return final_products
 
     def get_form(self, observation_type):
         return self.observation_forms.get(observation_type, MMTBaseObservationForm)
 
+    @metrics.instrument
     def get_observation_status(self, observation_id):
-        token = ObservationRecord.objects.get(observation_id=observation_id).parameters.get('program')
-        target = pymmt.Target(token=token, payload={'targetid': observation_id})
+        token = token_resolver.get(observation_id)
+        return self._get_target_status(token, observation_id)
+
+    @metrics.instrument
+    def get_observation_statuses(self, observation_ids):
+        observation_ids = [str(observation_id) for observation_id in observation_ids]
+        tokens = token_resolver.prefetch(observation_ids)
+        statuses = self._get_target_statuses(tokens)
+        for observation_id in observation_ids:
+            if observation_id not in tokens:
+                statuses[observation_id] = {'state': 'UNKNOWN', 'scheduled_start': None, 'scheduled_end': None,
+                                            'error': 'No records exist for that observation id'}
+        return statuses
+
+    @metrics.instrument
+    def update_all_observation_statuses(self, target=None):
+        records = ObservationRecord.objects.filter(facility=self.name)
+        if target:
+            records = records.filter(target=target)
+        records = list(records.exclude(status__in=self.get_terminal_observing_states()))
+        if settings.FACILITIES['MMT'].get('adaptive_polling', False):
+            from tom_mmt.polling import poll_statuses
+            return poll_statuses(self, records, force=target is not None)
+        statuses = self._get_target_statuses({record.observation_id: record.parameters.get('program')
+                                              for record in records})
+        failed_records = []
+        for record in records:
+            status = statuses[record.observation_id]
+            if 'error' in status:
+                failed_records.append((record.observation_id, status['error']))
+                continue
+            record.status = status['state']
+            record.scheduled_start = status['scheduled_start']
+            record.scheduled_end = status['scheduled_end']
+            record.save()
+        return failed_records
+
+    def _get_target_statuses(self, tokens):  # tokens = {observation_id: token}
+        import requests
+        statuses = {}
+        with ThreadPoolExecutor(max_workers=settings.FACILITIES['MMT'].get('status_workers', 8)) as executor:
+            futures = {observation_id: executor.submit(self._get_target_status, token, observation_id)
+                       for observation_id, token in tokens.items()}
+            for observation_id, future in futures.items():
+                try:
+                    statuses[observation_id] = future.result()
+                except Exception as e:  # report per observation rather than failing the whole batch
+                    logger.warning('Could not get status of MMT observation {}: {}'
+                                   .format(observation_id, api.redact(e)))
+                    # connection errors mean the API is failing, while others (e.g., a non-JSON response to a
+                    # deleted target) only affect this observation
+                    statuses[observation_id] = {'state': 'UNKNOWN', 'scheduled_start': None, 'scheduled_end': None,
+                                                'error': api.redact(e),
+                                                'connection_error': isinstance(e, requests.RequestException)}
+        return statuses
+
+    def _get_target_status(self, token, observation_id):
+        target = api.Target(token=token, payload={'targetid': observation_id})
         if not target.request.ok:
-            status = 'UNKNOWN'
+            # the status code tells adaptive polling whether the API is failing or only this target
+            return {'state': 'UNKNOWN', 'scheduled_start': None, 'scheduled_end': None,
+                    'status_code': target.request.status_code}
         elif target.disabled:
             status = 'CANCELED'
         elif target.iscomplete:
@@ -371,51 +627,145 @@ class MMTFacility(BaseRoboticObservationFacility):
             status = 'PENDING'
         return {'state': status, 'scheduled_start': None, 'scheduled_end': None}
 
+    @metrics.instrument
     def submit_observation(self, observation_payload):
-        target = pymmt.Target(token=observation_payload['program'], payload=observation_payload)
+        target = self._get_validated_target(observation_payload)
         target.post()
-        target.upload_finder(observation_payload['finder_chart'])
+        if observation_payload.get('finder_chart'):  # imaging requests do not have finder charts
+            target.upload_finder(observation_payload['finder_chart'])
         return [target.id]
 
+    @metrics.instrument
+    def submit_observations(self, observation_requests, user=None):
+        """
+        Validate and submit many observation requests concurrently, where each request is a tuple of
+        (target, observation_type, parameters). A finder chart can be given as a file path, which is not opened
+        until its upload. Returns a list of dictionaries, in the same order as the requests, containing the new
+        ObservationRecord or the validation errors.
+        """
+        results = []
+        valid_forms = []
+        for target, observation_type, parameters in observation_requests:
+            data = dict(parameters, target_id=target.id, facility=self.name, observation_type=observation_type)
+            result = {'target': target, 'observation_type': observation_type, 'record': None, 'errors': None}
+            results.append(result)
+            files = {}
+            if isinstance(data.get('finder_chart'), str):
+                try:
+                    files['finder_chart'] = LazyFile(data.pop('finder_chart'))
+                except OSError as e:  # reported like the other validation errors
+                    result['errors'] = {'finder_chart': [{'message': str(e), 'code': 'invalid'}]}
+                    continue
+            form = self.get_form(observation_type)(data=data, files=files)
+            if form.is_valid():
+                valid_forms.append((result, form))
+            else:
+                result['errors'] = form.errors.get_json_data()
+
+        # space out the requests to each program so that a long list does not flood the API
+        interval = settings.FACILITIES['MMT'].get('submission_interval', 1.)
+        rate_limiters = {form.cleaned_data['program']: RateLimiter(interval) for result, form in valid_forms}
+
+        def submit(form):
+            observation_payload = form.observation_payload()
+            rate_limiters[observation_payload['program']].wait()
+            try:
+                return self.submit_observation(observation_payload)
+            finally:
+                if observation_payload.get('finder_chart'):
+                    observation_payload['finder_chart'].close()
+
+        records = []
+        with ThreadPoolExecutor(max_workers=settings.FACILITIES['MMT'].get('submission_workers', 4)) as executor:
+            futures = [executor.submit(submit, form) for result, form in valid_forms]
+            for (result, form), future in zip(valid_forms, futures):
+                try:
+                    observation_ids = future.result()
+                except Exception as e:
+                    logger.error('Failed to submit MMT observation of {}: {}'.format(result['target'], api.redact(e)))
+                    result['errors'] = {'__all__': [{'message': api.redact(e), 'code': ''}]}
+                    continue
+                result['record'] = ObservationRecord(
+                    target=result['target'],
+                    user=user,
+                    facility=self.name,
+                    parameters=form.serialize_parameters(),
+                    observation_id=observation_ids[0],
+                )
+                records.append(result['record'])
+        ObservationRecord.objects.bulk_create(records)
+        return results
+
+    @metrics.instrument
     def validate_observation(self, observation_payload):
-        # Target.validate is automatically called by Target.__init__
-        target = pymmt.Target(token=observation_payload['program'], payload=observation_payload)
+        target = self._get_validated_target(observation_payload)
         return target.message['Errors']
 
+    def _get_validated_target(self, observation_payload):
+        # the form validates the payload before it is submitted, so reuse that target instead of validating again
+        cache_key = f'mmt_validated_target_{payload_hash(observation_payload)}'
+        target = cache.get(cache_key)
+        metrics.cache_lookup('validated_target', target is not None)
+        if target is None:
+            # Target.validate is automatically called by Target.__init__
+            target = api.Target(token=observation_payload['program'], payload=observation_payload)
+            cache.set(cache_key, target, settings.FACILITIES['MMT'].get('validation_cache_ttl', 600))
+        return target
+
     def get_terminal_observing_states(self):
         return ['CANCELED', 'COMPLETED']
 
     def get_observing_sites(self):
         return self.SITES
 
+    @metrics.instrument
+    def get_observability(self, targets, date=None, airmass_limit=None):
+        """
+        Return a dictionary for each target with the hours it spends below the airmass limit during the night of the
+        given date (default tonight) at the MMT, its minimum airmass, the time of that minimum, and its separation
+        from the Moon. All targets are evaluated at once, so this is fast for long lists.
+        """
+        airmass_limit = airmass_limit or settings.FACILITIES['MMT'].get('airmass_limit', 2.)
+        night = get_night(self.SITES['F. L. Whipple'], date)
+        # non-sidereal targets have no coordinates, so they are never observable
+        ra = [target.ra if target.ra is not None else math.nan for target in targets]
+        dec = [target.dec if target.dec is not None else math.nan for target in targets]
+        observability = night.observability(ra, dec, airmass_limit)
+        return [{
+            'target': target,
+            'hours_observable': float(observability['hours_observable'][i]),
+            'min_airmass': float(observability['min_airmass'][i]),
+            'best_time': julian_date_to_datetime(observability['best_time'][i])
+                         if math.isfinite(observability['min_airmass'][i]) else None,
+            'moon_separation': float(observability['moon_separation'][i]),
+        } for i, target in enumerate(targets)]
+
+    def rank_targets(self, targets, date=None, airmass_limit=None, min_hours=0.):
+        """
+        Return the observability of the targets that are observable for at least min_hours, with the longest observable
+        first and ties broken by the lowest airmass
+        """
+        observabilities = [observability for observability in self.get_observability(targets, date, airmass_limit)
+                           if observability['hours_observable'] >= min_hours]
+        return sorted(observabilities, key=lambda observability: (-observability['hours_observable'],
+                                                                  observability['min_airmass']))
+
+    @metrics.instrument
     def cancel_observation(self, observation_id):
-        token = ObservationRecord.objects.get(observation_id=observation_id).parameters.get('program')
-        target = pymmt.Target(token=token, payload={'targetid': observation_id})
+        token = token_resolver.get(observation_id)
+        target = api.Target(token=token, payload={'targetid': observation_id})
         target.delete()
 
+    @metrics.instrument
     def get_observation_url(self, observation_id):
-        token = ObservationRecord.objects.get(observation_id=observation_id).parameters.get('program')
+        token = token_resolver.get(observation_id)
         # javascript is required to get to the observation_id level, but this is close enough
         return f"https://scheduler.mmto.arizona.edu/catalog.php?token={token}"
 
+    @metrics.instrument
     def get_facility_status(self):
-        queues = pymmt.Instruments().get_instruments()
-        if queues:
-            status = queues[0].get('name', 'UNKNOWN')
-        else:
-            response = requests.get('https://scheduler.mmto.arizona.edu/APIv2/trimester//schedule/all')
-            schedule = response.json()
-            for run in schedule['published']['runs']:
-                start = datetime.strptime(run['start'], '%Y-%m-%d %H:%M:%S-%f')
-                end = datetime.strptime(run['end'], '%Y-%m-%d')
-                if start < datetime.now() < end:
-                    if run.get('instrument') is not None:
-                        status = f"{run['instrument']['name']} ({run['title']})"
-                    else:
-                        status = run['title']
-                    break
-            else:
-                status = 'NO RUN SCHEDULED'
+        # the queue and run schedules come from the same trimester schedule, which is cached by get_schedule
+        status = get_schedule().get_status()
         facility_status = {
             'code': 'MMT',
             'sites': [{
@@ -434,22 +784,44 @@ class MMTFacility(BaseRoboticObservationFacility):
 
 
 class MMTDataProcessor(DataProcessor):
+    SPECTROSCOPY_PROCESSOR = 'tom_dataproducts.processors.spectroscopy_processor.SpectroscopyProcessor'
+
+    @metrics.instrument
     def process_data(self, data_product):
-        mimetype = mimetypes.guess_type(data_product.data.path)[0]
-        if mimetype == 'application/x-tar':
+        mimetype = mimetypes.guess_type(data_product.data.name)[0]
+        if mimetype == 'application/x-tar':  # including compressed tarballs, e.g., .tar.gz and .tgz
             logger.info('Untarring MMT file: {}'.format(data_product.data))
-            with TarFile(fileobj=data_product.data) as tarfile:
-                for member in tarfile.getmembers():
-                    if member.name.endswith('_B.fits'):
-                        fitsfile = tarfile.extractfile(member)
-                        fitsname = os.path.basename(member.name)
-                        dp, created = DataProduct.objects.get_or_create(
-                            product_id=member.name,
-                            target=data_product.target,
-                            observation_record=data_product.observation_record,
-                            data=ContentFile(fitsfile.read(), fitsname),
-                            data_product_type='spectroscopy',
-                        )
-                        logger.info('Saved new dataproduct: {}'.format(dp.data))
-                        run_data_processor(dp)
+            # spectra are read by ingest_spectra unless a custom spectroscopy processor is configured
+            builtin_processor = settings.DATA_PROCESSORS.get('spectroscopy') == self.SPECTROSCOPY_PROCESSOR
+            with transaction.atomic():  # one transaction for the whole tarball
+                new_products = self.extract_spectra(data_product)
+                if builtin_processor:
+                    n_created = ingest_spectra(new_products)
+                    logger.info('{} new spectra added from {}'.format(n_created, data_product.data))
+            if not builtin_processor:
+                run_data_processors(new_products)
         return []
+
+    def extract_spectra(self, data_product):
+        new_products = []
+        # read the tarball as a stream so that members are copied to storage in chunks, one at a time
+        with data_product.data.open('rb') as f, tarfile.open(fileobj=f, mode='r|*') as tar:
+            for member in tar:
+                if member.isfile() and member.name.endswith('_B.fits'):
+                    dp, created = DataProduct.objects.get_or_create(
+                        product_id=member.name,
+                        defaults={
+                            'target': data_product.target,
+                            'observation_record': data_product.observation_record,
+                            'data_product_type': 'spectroscopy',
+                        }
+                    )
+                    if created:
+                        fitsfile = File(tar.extractfile(member), os.path.basename(member.name))
+                        fitsfile.size = member.size
+                        with metrics.timer('storage_write_seconds'):
+                            dp.data.save(fitsfile.name, fitsfile)
+                        metrics.increment('extracted_bytes', member.size)
+                        logger.info('Saved new dataproduct: {}'.format(dp.data))
+                        new_products.append(dp)
+        return new_products
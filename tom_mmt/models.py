@@ -0,0 +1,52 @@
+from django.db import models
+from tom_dataproducts.models import DataProduct
+from tom_observations.models import ObservationRecord
+
+
+class IngestionJob(models.Model):
+    """Deferred download and processing of one MMT datafile, which is run by the run_mmt_ingestion command"""
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    COMPLETED = 'COMPLETED'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (COMPLETED, 'Completed'),
+        (FAILED, 'Failed'),
+    ]
+
+    observation_record = models.ForeignKey(ObservationRecord, on_delete=models.CASCADE,
+                                           related_name='mmt_ingestion_jobs')
+    datafile_id = models.CharField(max_length=255)
+    # created with its file when the job runs, so that a data product without a file is never visible
+    data_product = models.OneToOneField(DataProduct, null=True, blank=True, on_delete=models.CASCADE,
+                                        related_name='mmt_ingestion_job')
+    filename = models.CharField(max_length=255)
+    checksum = models.CharField(max_length=64, blank=True, default='')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created']
+        constraints = [
+            models.UniqueConstraint(fields=['observation_record', 'datafile_id'], name='unique_mmt_ingestion_job'),
+        ]
+
+    def __str__(self):
+        return f'MMT datafile {self.datafile_id} ({self.status})'
+
+
+class PollSchedule(models.Model):
+    """When the status of an MMT observation should next be polled, which is used by adaptive polling"""
+    observation_record = models.OneToOneField(ObservationRecord, on_delete=models.CASCADE,
+                                              related_name='mmt_poll_schedule')
+    next_poll = models.DateTimeField(db_index=True)
+    interval = models.FloatField()  # seconds
+    last_polled = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'Poll MMT observation {self.observation_record.observation_id} at {self.next_poll}'
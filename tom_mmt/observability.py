@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.core.cache import cache
+from tom_mmt.metrics import metrics
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+UTC_OFFSET = timedelta(hours=-7)  # Arizona does not observe daylight saving time
+J2000 = datetime(2000, 1, 1, 12, tzinfo=timezone.utc)
+
+
+def tonight():
+    """Date of the night in progress, or of the coming night if it is before noon in Arizona"""
+    return (datetime.now(timezone.utc) + UTC_OFFSET - timedelta(hours=12)).date()
+
+
+class Night:
+    """
+    Times of darkness during one night at a site, with the local sidereal time at each one and the position of the
+    Moon in the middle of the night. The night of a date starts at local noon on that date.
+    """
+    def __init__(self, site, date, step=10., twilight=-12.):
+        # slow to import, and only needed once per night
+        from astropy.coordinates import EarthLocation, AltAz, get_body
+        from astropy.time import Time
+        import astropy.units as u
+        location = EarthLocation.from_geodetic(site['longitude'] * u.deg, site['latitude'] * u.deg,
+                                               site['elevation'] * u.m)
+        start = datetime(date.year, date.month, date.day, 12, tzinfo=timezone.utc) - UTC_OFFSET
+        times = Time(start) + np.arange(0., 24. * 60. + step, step) * u.min
+        sun = get_body('sun', times, location).transform_to(AltAz(obstime=times, location=location))
+        dark = sun.alt.deg < twilight
+        times = times[dark]
+        self.latitude = np.radians(site['latitude'])
+        self.step_hours = step / 60.
+        self.jd = times.jd
+        self.lst = times.sidereal_time('mean', longitude=site['longitude'] * u.deg).rad
+        if len(times):
+            moon = get_body('moon', times[len(times) // 2], location)
+            self.moon_ra, self.moon_dec = moon.ra.rad, moon.dec.rad
+        else:  # no darkness at this site and date
+            self.moon_ra = self.moon_dec = np.nan
+
+    def observability(self, ra, dec, airmass_limit=2.):
+        """
+        Evaluate arrays of coordinates (in degrees) at every time during the night at once. Returns a dictionary of
+        arrays with an element for each target: the hours spent below the airmass limit, the minimum airmass, the
+        time (as a Julian date) when that minimum is reached, and the separation from the Moon (in degrees).
+        Precession and refraction are ignored, which changes the altitudes by less than a degree.
+        """
+        ra = np.radians(np.asarray(ra, dtype=float))[:, np.newaxis]
+        dec = np.radians(np.asarray(dec, dtype=float))[:, np.newaxis]
+        if not len(self.jd):
+            nans = np.full(len(ra), np.nan)
+            return {'hours_observable': np.zeros(len(ra)), 'min_airmass': nans, 'best_time': nans,
+                    'moon_separation': nans}
+        sin_altitude = (np.sin(dec) * np.sin(self.latitude) +
+                        np.cos(dec) * np.cos(self.latitude) * np.cos(self.lst - ra))
+        with np.errstate(divide='ignore'):
+            airmass = np.where(sin_altitude > 0., 1. / sin_altitude, np.inf)
+        best = np.argmin(airmass, axis=1)
+        cos_separation = (np.sin(dec[:, 0]) * np.sin(self.moon_dec) +
+                          np.cos(dec[:, 0]) * np.cos(self.moon_dec) * np.cos(ra[:, 0] - self.moon_ra))
+        return {
+            'hours_observable': (airmass <= airmass_limit).sum(axis=1) * self.step_hours,
+            'min_airmass': airmass[np.arange(len(best)), best],
+            'best_time': self.jd[best],
+            'moon_separation': np.degrees(np.arccos(np.clip(cos_separation, -1., 1.))),
+        }
+
+
+def get_night(site, date=None):
+    """Return the Night for a site and date, which is only computed once and then cached"""
+    mmt_settings = settings.FACILITIES['MMT']
+    date = date or tonight()
+    step = mmt_settings.get('observability_step', 10.)
+    twilight = mmt_settings.get('twilight', -12.)
+    cache_key = f"mmt_night_{site['sitecode']}_{date.isoformat()}_{step}_{twilight}"
+    night = cache.get(cache_key)
+    metrics.cache_lookup('night', night is not None)
+    if night is None:
+        night = Night(site, date, step, twilight)
+        cache.set(cache_key, night, mmt_settings.get('ephemeris_cache_ttl', 7 * 86400))
+    return night
+
+
+def julian_date_to_datetime(jd):
+    return J2000 + timedelta(days=float(jd) - 2451545.)
@@ -0,0 +1,156 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from tom_mmt.models import PollSchedule
+from tom_mmt.schedule import get_schedule
+from tom_mmt.metrics import metrics
+from datetime import timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Stops polling for a while after the MMT API fails threshold times in a row, counting only connection errors and 429
+    or 5xx responses. The state is kept in the Django cache so that it is shared by all processes. Once the timeout has
+    passed, the least recently polled observation is polled as a probe, and polling resumes if the API answers.
+    """
+    def __init__(self, threshold=5, timeout=600.):
+        self.threshold = threshold
+        self.timeout = timeout
+
+    @property
+    def failures(self):
+        return cache.get('mmt_poll_failures', 0)
+
+    def is_open(self):
+        return cache.get('mmt_poll_circuit_open', False)
+
+    def is_half_open(self):
+        return not self.is_open() and self.failures >= self.threshold
+
+    def record(self, successes, failures):
+        if successes:
+            cache.delete('mmt_poll_failures')
+        elif failures:
+            total_failures = self.failures + failures
+            cache.set('mmt_poll_failures', total_failures, None)
+            if total_failures >= self.threshold:
+                logger.warning('MMT API failed {} times in a row, pausing status polling for {} s'
+                               .format(total_failures, self.timeout))
+                cache.set('mmt_poll_circuit_open', True, self.timeout)
+                metrics.increment('poll_circuit_opened')
+
+
+def get_circuit_breaker():
+    mmt_settings = settings.FACILITIES['MMT']
+    return CircuitBreaker(mmt_settings.get('circuit_breaker_threshold', 5),
+                          mmt_settings.get('circuit_breaker_timeout', 600.))
+
+
+def next_interval(interval, changed, instrument_active):
+    """
+    Return the seconds until the next poll: the minimum right after the status changes (including the percentage
+    completed), then growing by the backoff factor, up to a lower maximum while the instrument is scheduled
+    """
+    mmt_settings = settings.FACILITIES['MMT']
+    min_interval = mmt_settings.get('poll_interval_min', 300.)
+    if changed:
+        return min_interval
+    if instrument_active:
+        max_interval = mmt_settings.get('poll_interval_active', 1800.)
+    else:
+        max_interval = mmt_settings.get('poll_interval_max', 86400.)
+    return max(min(interval * mmt_settings.get('poll_backoff', 2.), max_interval), min_interval)
+
+
+def is_api_failure(status):
+    """Whether a status could not be fetched because the API is failing, rather than because of its target"""
+    status_code = status.get('status_code') or 0
+    return status.get('connection_error', False) or status_code == 429 or status_code >= 500
+
+
+def poll_statuses(facility, records, force=False):
+    """
+    Update the status of each record that is due to be polled (or all of them, if force is True), and schedule its
+    next poll. Returns a list of (observation_id, error) tuples for the records that could not be updated, like
+    update_all_observation_statuses.
+    """
+    now = timezone.now()
+    mmt_settings = settings.FACILITIES['MMT']
+    min_interval = mmt_settings.get('poll_interval_min', 300.)
+    active_interval = timedelta(seconds=mmt_settings.get('poll_interval_active', 1800.))
+    circuit_breaker = get_circuit_breaker()
+    if circuit_breaker.is_open():
+        logger.info('Skipping MMT status polling while the API is failing')
+        return []
+
+    schedules = {schedule.observation_record_id: schedule
+                 for schedule in PollSchedule.objects.filter(observation_record__in=records)}
+    new_schedules = [PollSchedule(observation_record=record, next_poll=now, interval=min_interval)
+                     for record in records if record.pk not in schedules]
+    for schedule in PollSchedule.objects.bulk_create(new_schedules):
+        schedules[schedule.observation_record_id] = schedule
+    try:
+        active_instruments = get_schedule().active_instruments()
+    except Exception as e:  # poll at the usual rate if the schedule is unavailable
+        logger.warning('Could not get the MMT schedule: {}'.format(e))
+        active_instruments = set()
+
+    def is_active(record):
+        form = facility.get_form(record.parameters.get('observation_type'))
+        return getattr(form, 'instrumentid', None) in active_instruments
+
+    def is_due(record):
+        schedule = schedules[record.pk]
+        if force or schedule.next_poll <= now:
+            return True
+        # a record that backed off while its instrument was idle is polled sooner once the instrument is scheduled
+        return is_active(record) and (schedule.last_polled is None or schedule.last_polled + active_interval <= now)
+
+    if circuit_breaker.is_half_open() and records:
+        # probe with the least recently polled record, so that the same observation is not tried every time
+        due_records = [min(records, key=lambda record: (schedules[record.pk].last_polled is not None,
+                                                        schedules[record.pk].last_polled or now))]
+    else:
+        due_records = [record for record in records if is_due(record)]
+    metrics.increment('poll_skipped', len(records) - len(due_records))
+    if not due_records:
+        return []
+
+    statuses = facility._get_target_statuses({record.observation_id: record.parameters.get('program')
+                                              for record in due_records})
+    failed_records = []
+    api_failures = 0
+    terminal_states = facility.get_terminal_observing_states()
+    for record in due_records:
+        status = statuses[record.observation_id]
+        schedule = schedules[record.pk]
+        schedule.last_polled = now
+        if 'error' in status or status['state'] == 'UNKNOWN':
+            failed_records.append((record.observation_id,
+                                   status.get('error') or 'MMT API returned {}'.format(status.get('status_code'))))
+            if is_api_failure(status):  # try again soon without resetting the backoff
+                api_failures += 1
+                schedule.next_poll = now + timedelta(seconds=min_interval)
+            else:  # the API is working, so back off as if the status had not changed
+                schedule.interval = next_interval(schedule.interval, False, is_active(record))
+                schedule.next_poll = now + timedelta(seconds=schedule.interval)
+            continue
+        changed = status['state'] != record.status
+        record.status = status['state']
+        record.scheduled_start = status['scheduled_start']
+        record.scheduled_end = status['scheduled_end']
+        record.save()
+        schedule.interval = next_interval(schedule.interval, changed, is_active(record))
+        schedule.next_poll = now + timedelta(seconds=schedule.interval)
+    circuit_breaker.record(len(due_records) - api_failures, api_failures)
+    metrics.increment('poll_requests', len(due_records))
+
+    PollSchedule.objects.bulk_update([schedules[record.pk] for record in due_records],
+                                     ['interval', 'next_poll', 'last_polled'])
+    # terminal states are never polled again
+    PollSchedule.objects.filter(observation_record__in=[record for record in due_records
+                                                        if record.status in terminal_states]).delete()
+    return failed_records
@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.core.cache import cache
+from bisect import bisect_left
+from datetime import datetime
+from tom_mmt.api import get_session, get_base_url
+from tom_mmt.metrics import metrics
+
+
+class IntervalIndex:
+    """
+    Sorted index of (start, end, value) intervals, so that the intervals containing a given time can be found by
+    bisection instead of scanning the whole list
+    """
+    def __init__(self, intervals):
+        intervals = sorted(intervals, key=lambda interval: interval[0])
+        self.starts = [start for start, end, value in intervals]
+        self.ends = [end for start, end, value in intervals]
+        self.values = [value for start, end, value in intervals]
+        # running maximum of the end times, so we know when to stop searching backward
+        self.max_ends = []
+        for end in self.ends:
+            self.max_ends.append(max(end, self.max_ends[-1]) if self.max_ends else end)
+
+    def __len__(self):
+        return len(self.values)
+
+    def find(self, time):
+        """Return the values of all intervals that contain the given time, ordered by start time"""
+        found = []
+        i = bisect_left(self.starts, time) - 1
+        while i >= 0 and self.max_ends[i] > time:
+            if self.ends[i] > time:
+                found.append(self.values[i])
+            i -= 1
+        return found[::-1]
+
+
+class Schedule:
+    """Queue runs and classical runs from the published MMT trimester schedule"""
+    def __init__(self, schedule):
+        published = schedule['published']
+        self.queues = IntervalIndex(
+            (datetime.strptime(queuerun['startdate'], '%Y-%m-%d %H:%M:%S-%f'),
+             datetime.strptime(queuerun['enddate'], '%Y-%m-%d %H:%M:%S-%f'),
+             {'instrumentid': queue['instrumentid'], 'name': queue['name']})
+            for queue in published['queues'] for queuerun in queue['queueruns']
+        )
+        self.runs = IntervalIndex(
+            (datetime.strptime(run['start'], '%Y-%m-%d %H:%M:%S-%f'),
+             datetime.strptime(run['end'], '%Y-%m-%d'),
+             {'title': run['title'], 'instrument': run.get('instrument')})
+            for run in published['runs']
+        )
+
+    def get_status(self, time=None):
+        if time is None:
+            time = datetime.now()
+        queues = self.queues.find(time)
+        if queues:
+            return queues[0].get('name', 'UNKNOWN')
+        runs = self.runs.find(time)
+        if not runs:
+            return 'NO RUN SCHEDULED'
+        elif runs[0]['instrument'] is not None:
+            return f"{runs[0]['instrument']['name']} ({runs[0]['title']})"
+        else:
+            return runs[0]['title']
+
+    def active_instruments(self, time=None):
+        """Return the IDs of the instruments that have a queue or a run scheduled at the given time"""
+        if time is None:
+            time = datetime.now()
+        instrument_ids = {queue['instrumentid'] for queue in self.queues.find(time)}
+        instrument_ids.update(run['instrument'].get('id') for run in self.runs.find(time)
+                              if run['instrument'] is not None)
+        return instrument_ids
+
+
+def get_schedule():
+    schedule = cache.get('mmt_schedule')
+    metrics.cache_lookup('schedule', schedule is not None)
+    if schedule is None:
+        response = get_session().get(f'{get_base_url()}/trimester//schedule/all')
+        response.raise_for_status()
+        schedule = Schedule(response.json())
+        cache.set('mmt_schedule', schedule, settings.FACILITIES['MMT'].get('schedule_cache_ttl', 3600))
+    return schedule
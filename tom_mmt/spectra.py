@@ -0,0 +1,94 @@
+from django.conf import settings
+from tom_dataproducts.models import try_parse_reduced_datum
+from tom_targets.sharing import continuous_share_data
+from tom_mmt.metrics import metrics
+from datetime import datetime, timezone
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# same units as the built-in spectroscopy processor
+FLUX_UNITS = 'erg / (Angstrom s cm2)'
+WAVELENGTH_UNITS = 'Angstrom'
+
+
+def open_fits(data_product):
+    from astropy.io import fits  # slow to import, so only when a spectrum is read
+    # memory map the file if it is on the local filesystem, so that only the data actually used are read
+    try:
+        return fits.open(data_product.data.path, memmap=True)
+    except NotImplementedError:  # storage backends without local paths
+        return fits.open(data_product.data.open('rb'))
+
+
+def read_spectrum(data_product):
+    """
+    Read a Binospec or MMIRS 1D spectrum, returning the fields of its SpectroscopyReducedDatum. The flux is taken from
+    the first HDU with data, and the wavelengths are computed from the linear WCS in its header.
+    """
+    with open_fits(data_product) as hdulist:
+        hdu = next(hdu for hdu in hdulist if hdu.data is not None)
+        header = hdu.header
+        flux = hdu.data
+        if flux.ndim == 3:
+            flux = flux[0, 0, :]
+        elif flux.shape[0] == 2:
+            flux = flux[0, :]
+        pixels = np.arange(1, flux.shape[-1] + 1)
+        wavelength = header.get('CRVAL1', 0.) + (pixels - header.get('CRPIX1', 1.)) * \
+            header.get('CDELT1', header.get('CD1_1', 1.))
+        if 'DATE-OBS' in header:
+            from astropy.time import Time
+            timestamp = Time(header['DATE-OBS']).to_datetime(timezone=timezone.utc)
+        else:
+            timestamp = datetime.now(timezone.utc)
+        return {
+            'timestamp': timestamp,
+            'telescope': 'MMT',
+            'instrument': header.get('INSTRUME', ''),
+            'exposure_time': header.get('EXPTIME'),
+            'flux': flux.tolist(),
+            'flux_units': FLUX_UNITS,
+            'wavelength': wavelength.tolist(),
+            'wavelength_units': WAVELENGTH_UNITS,
+        }
+
+
+def ingest_spectra(data_products):
+    """
+    Read the spectrum in each data product and insert them as reduced data in batches of up to
+    reduced_datum_batch_size spectra or reduced_datum_batch_pixels pixels, whichever comes first, since each pixel
+    is held in memory as Python floats until it is inserted. Returns the number of reduced data created.
+    """
+    batch_size = settings.FACILITIES['MMT'].get('reduced_datum_batch_size', 50)
+    batch_pixels = settings.FACILITIES['MMT'].get('reduced_datum_batch_pixels', 100000)
+    batch = []
+    n_pixels = 0
+    n_created = 0
+
+    def insert(batch):
+        reduced_datums = type(batch[0]).objects.bulk_create(batch, ignore_conflicts=True)
+        try:  # sharing failures should not prevent ingestion, as in run_data_processor
+            continuous_share_data(batch[0].target, reduced_datums)
+        except Exception as e:
+            logger.warning('Failed to share new MMT spectra: {!r}'.format(e))
+        return len(reduced_datums)
+
+    for data_product in data_products:
+        try:
+            with metrics.timer('spectrum_read_seconds'):
+                spectrum = read_spectrum(data_product)
+        except Exception as e:
+            logger.error('Failed to read spectrum from data product {}: {}'.format(data_product, e))
+            continue
+        batch.append(try_parse_reduced_datum(dict(spectrum, target=data_product.target, data_product=data_product,
+                                                  source_name='MMT', data_type='spectroscopy')))
+        n_pixels += len(spectrum['flux'])
+        if len(batch) >= batch_size or n_pixels >= batch_pixels:
+            n_created += insert(batch)
+            batch = []
+            n_pixels = 0
+    if batch:
+        n_created += insert(batch)
+    return n_created
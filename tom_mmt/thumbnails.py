@@ -0,0 +1,78 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from tom_dataproducts.models import DataProduct
+from tom_dataproducts.utils import create_image_dataproduct
+from tom_mmt.metrics import metrics
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def file_signature(field_file):
+    """
+    Identify the contents of a stored file by its size and modification time, or by a hash of its contents if the
+    storage backend does not report modification times
+    """
+    try:
+        return f'{field_file.size}:{field_file.storage.get_modified_time(field_file.name).timestamp()}'
+    except NotImplementedError:
+        sha256 = hashlib.sha256()
+        with field_file.open('rb') as f:
+            for chunk in f.chunks():
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+
+def make_thumbnails(data_product):
+    """
+    Create the image data product and the preview thumbnail of a data product, unless they were already made from a
+    file with the same signature
+    """
+    if not data_product.data:
+        return
+    cache_key = f'mmt_thumbnail_{data_product.pk}'
+    signature = file_signature(data_product.data)
+    previous_signature = cache.get(cache_key)
+    metrics.cache_lookup('thumbnail', previous_signature == signature)
+    if previous_signature == signature:
+        return
+    create_image_dataproduct(data_product)
+    data_product.get_preview(redraw=previous_signature is not None)  # the file changed since the last preview
+    cache.set(cache_key, signature, settings.FACILITIES['MMT'].get('thumbnail_cache_ttl', None))
+
+
+def _make_thumbnails(data_product_id):
+    try:
+        make_thumbnails(DataProduct.objects.get(pk=data_product_id))
+    except Exception as e:
+        logger.error('Failed to create thumbnails for data product {}: {}'.format(data_product_id, e))
+    finally:
+        connection.close()  # each worker thread has its own database connection
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.FACILITIES['MMT']['thumbnail_workers'],
+                                               thread_name_prefix='mmt-thumbnails')
+    return _executor
+
+
+def update_thumbnails(data_product):
+    """
+    Make the thumbnails of a data product, either now or, if thumbnail_workers is set, in a background thread after
+    the current transaction is committed
+    """
+    if settings.FACILITIES['MMT'].get('thumbnail_workers', 0) > 0:
+        transaction.on_commit(lambda: get_executor().submit(_make_thumbnails, data_product.pk))
+    else:
+        make_thumbnails(data_product)
@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from tom_observations.models import ObservationRecord
+from tom_mmt.metrics import metrics
+from collections import OrderedDict
+import threading
+
+
+class TokenResolver:
+    """
+    In-process LRU cache of the program API token for each MMT observation ID, so that looking up a token does not
+    require fetching and decoding the whole ObservationRecord every time
+    """
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize
+        self._tokens = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded_all = False
+
+    def get(self, observation_id):
+        observation_id = str(observation_id)
+        with self._lock:
+            if observation_id in self._tokens:
+                self._tokens.move_to_end(observation_id)
+                metrics.cache_lookup('token', True)
+                return self._tokens[observation_id]
+        if not self._loaded_all:
+            metrics.cache_lookup('token', False)
+            # on the first miss, load every MMT token in one query, so that pages listing many observations only
+            # hit the database once
+            self._loaded_all = True
+            self._update(ObservationRecord.objects.filter(facility='MMT')
+                         .values_list('observation_id', 'parameters__program'))
+        else:
+            self.prefetch([observation_id])
+        with self._lock:
+            if observation_id not in self._tokens:
+                raise ObservationRecord.DoesNotExist(f'No records exist for observation id {observation_id}')
+            return self._tokens[observation_id]
+
+    def prefetch(self, observation_ids):
+        """Load the tokens for many observation IDs with one query, and return the ones that were found"""
+        observation_ids = [str(observation_id) for observation_id in observation_ids]
+        with self._lock:
+            missing = [observation_id for observation_id in observation_ids if observation_id not in self._tokens]
+        if metrics.enabled:
+            metrics.increment('cache_hits', len(observation_ids) - len(missing), cache='token')
+            metrics.increment('cache_misses', len(missing), cache='token')
+        if missing:
+            self._update(ObservationRecord.objects.filter(facility='MMT', observation_id__in=missing)
+                         .values_list('observation_id', 'parameters__program'))
+        with self._lock:
+            return {observation_id: self._tokens[observation_id]
+                    for observation_id in observation_ids if observation_id in self._tokens}
+
+    def set(self, observation_id, token):
+        self._update([(str(observation_id), token)])
+
+    def invalidate(self, observation_id):
+        with self._lock:
+            self._tokens.pop(str(observation_id), None)
+
+    def _update(self, tokens):
+        maxsize = self.maxsize or settings.FACILITIES['MMT'].get('token_cache_size', 10000)
+        with self._lock:
+            for observation_id, token in tokens:
+                self._tokens[observation_id] = token
+                self._tokens.move_to_end(observation_id)
+            while len(self._tokens) > maxsize:
+                self._tokens.popitem(last=False)
+
+
+token_resolver = TokenResolver()
+
+
+@receiver(post_save, sender=ObservationRecord)
+def update_token(sender, instance, **kwargs):
+    # keep the saved token rather than dropping it, since status updates save every record
+    if instance.facility == 'MMT':
+        token_resolver.set(instance.observation_id, instance.parameters.get('program'))
+    else:
+        token_resolver.invalidate(instance.observation_id)
+
+
+@receiver(post_delete, sender=ObservationRecord)
+def invalidate_token(sender, instance, **kwargs):
+    token_resolver.invalidate(instance.observation_id)